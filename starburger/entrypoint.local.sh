@@ -23,6 +23,7 @@ echo "Running as user: $(whoami)"
 
 log "Running migrations..."
 python manage.py migrate --noinput
+python manage.py createcachetable
 
 log "Collecting static..."
 python manage.py collectstatic --noinput
@@ -32,11 +33,15 @@ log "Starting Gunicorn server..."
 
 WORKERS="${GUNICORN_WORKERS:-3}"
 TIMEOUT="${GUNICORN_TIMEOUT:-120}"
+WORKER_CLASS="${GUNICORN_WORKER_CLASS:-gthread}"
+THREADS="${GUNICORN_THREADS:-8}"
 
-log "Workers: $WORKERS, Timeout: $TIMEOUT"
+log "Workers: $WORKERS ($WORKER_CLASS, threads: $THREADS), Timeout: $TIMEOUT"
 
 exec gunicorn \
     --workers $WORKERS \
+    --worker-class $WORKER_CLASS \
+    --threads $THREADS \
     --bind 0.0.0.0:8000 \
     --timeout $TIMEOUT \
     --access-logfile - \
@@ -85,6 +85,12 @@ else
     exit 1
 fi
 
+# Таблица кэша нужна, если CACHE_URL не задан или указывает на dbcache://
+if ! python manage.py createcachetable; then
+    log "✗ Cache table creation failed!"
+    exit 1
+fi
+
 # Сбор статики
 log "Collecting static files..."
 if python manage.py collectstatic --noinput --clear; then
@@ -98,12 +104,16 @@ log "Starting Gunicorn server..."
 
 WORKERS="${GUNICORN_WORKERS:-3}"
 TIMEOUT="${GUNICORN_TIMEOUT:-120}"
+WORKER_CLASS="${GUNICORN_WORKER_CLASS:-gthread}"
+THREADS="${GUNICORN_THREADS:-8}"
 PORT="${PORT:-8000}"
 
-log "Workers: $WORKERS, Timeout: $TIMEOUT, Port: $PORT"
+log "Workers: $WORKERS ($WORKER_CLASS, threads: $THREADS), Timeout: $TIMEOUT, Port: $PORT"
 
 exec gunicorn \
     --workers $WORKERS \
+    --worker-class $WORKER_CLASS \
+    --threads $THREADS \
     --bind 0.0.0.0:$PORT \
     --timeout $TIMEOUT \
     --access-logfile - \
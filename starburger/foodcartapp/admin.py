@@ -1,4 +1,4 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.shortcuts import reverse
 from django.templatetags.static import static
 from django.http import HttpResponseRedirect
@@ -6,12 +6,16 @@ from django.utils.html import format_html
 from django.utils.http import url_has_allowed_host_and_scheme
 from django.db.models import Sum, F
 
+from .images import DERIVATIVE_WIDTHS
+from .restaurants import locate_restaurant
 from .models import (
+    Banner,
     Product,
     ProductCategory,
     Restaurant,
     RestaurantMenuItem,
     Order,
+    OrderCandidate,
     OrderItem,
 )
 
@@ -24,6 +28,18 @@ class OrderItemInline(admin.TabularInline):
     fields = ["product", "quantity", "fixed_price"]
 
 
+class OrderCandidateInline(admin.TabularInline):
+    model = OrderCandidate
+    extra = 0
+    can_delete = False
+    fields = ["rank", "restaurant", "distance_km"]
+    readonly_fields = fields
+    ordering = ["rank"]
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 class RestaurantMenuItemInline(admin.TabularInline):
     model = RestaurantMenuItem
     extra = 1
@@ -41,6 +57,7 @@ class OrderAdmin(admin.ModelAdmin):
         "lastname",
         "phonenumber",
         "address",
+        "geocoding_status",
         "created_at",
         "called_at",
         "delivered_at",
@@ -49,7 +66,13 @@ class OrderAdmin(admin.ModelAdmin):
         "commentary",
     ]
 
-    list_filter = ["created_at", "status", "payment_type", "cooking_restaurant"]
+    list_filter = [
+        "created_at",
+        "status",
+        "payment_type",
+        "cooking_restaurant",
+        "geocoding_status",
+    ]
     search_fields = [
         "firstname",
         "lastname",
@@ -59,14 +82,24 @@ class OrderAdmin(admin.ModelAdmin):
         "payment_type",
         "cooking_restaurant",
     ]
-    readonly_fields = ["created_at", "get_total_order_price"]
+    readonly_fields = ["created_at", "get_total_order_price", "geocoding_status"]
+    raw_id_fields = ["location"]
 
-    inlines = [OrderItemInline]
+    inlines = [OrderItemInline, OrderCandidateInline]
 
     fieldsets = [
         (
             "Информация о клиенте",
-            {"fields": ["firstname", "lastname", "phonenumber", "address"]},
+            {
+                "fields": [
+                    "firstname",
+                    "lastname",
+                    "phonenumber",
+                    "address",
+                    "location",
+                    "geocoding_status",
+                ]
+            },
         ),
         ("Статус", {"fields": ["status"]}),
         ("Ресторан", {"fields": ["cooking_restaurant"]}),
@@ -173,18 +206,39 @@ class RestaurantAdmin(admin.ModelAdmin):
         "contact_phone",
     ]
 
-    list_display = ["name", "contact_phone", "address"]
+    list_display = ["name", "contact_phone", "address", "location"]
+    list_select_related = ["location"]
+    readonly_fields = ["location"]
     inlines = [RestaurantMenuItemInline]
 
+    def save_model(self, request, obj, form, change):
+        if not change or "address" in form.changed_data or obj.location_id is None:
+            if not locate_restaurant(obj):
+                self.message_user(
+                    request,
+                    f"Не удалось определить координаты адреса ресторана «{obj.name}»",
+                    level=messages.WARNING,
+                )
+        super().save_model(request, obj, form, change)
+
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ["get_image_list_preview", "name", "category", "price", "id"]
+    list_display = [
+        "get_image_list_preview",
+        "name",
+        "category",
+        "price",
+        "is_available",
+        "available_restaurants_count",
+        "id",
+    ]
     list_display_links = [
         "name",
     ]
     list_filter = [
         "category",
+        "is_available",
     ]
     search_fields = [
         # FIXME SQLite can not convert letter case for cyrillic words properly, so search will be buggy.
@@ -228,7 +282,8 @@ class ProductAdmin(admin.ModelAdmin):
         if not obj.image:
             return "выберите картинку"
         return format_html(
-            '<img src="{url}" style="max-height: 200px;"/>', url=obj.image.url
+            '<img src="{url}" style="max-height: 200px;"/>',
+            url=obj.get_image_thumbnail_url(320),
         )
 
     get_image_preview.short_description = "превью"
@@ -240,7 +295,7 @@ class ProductAdmin(admin.ModelAdmin):
         return format_html(
             '<a href="{edit_url}"><img src="{src}" style="max-height: 50px;"/></a>',
             edit_url=edit_url,
-            src=obj.image.url,
+            src=obj.get_image_thumbnail_url(DERIVATIVE_WIDTHS[0]),
         )
 
     get_image_list_preview.short_description = "превью"
@@ -249,3 +304,48 @@ class ProductAdmin(admin.ModelAdmin):
 @admin.register(ProductCategory)
 class ProductAdmin(admin.ModelAdmin):
     pass
+
+
+@admin.register(Banner)
+class BannerAdmin(admin.ModelAdmin):
+    list_display = [
+        "get_image_list_preview",
+        "title",
+        "position",
+        "is_active",
+        "active_from",
+        "active_until",
+    ]
+    list_display_links = ["title"]
+    list_editable = ["position", "is_active"]
+    list_filter = ["is_active"]
+    search_fields = ["title", "text"]
+    readonly_fields = ["get_image_preview"]
+    fields = [
+        "title",
+        "text",
+        "image",
+        "get_image_preview",
+        "position",
+        "is_active",
+        "active_from",
+        "active_until",
+    ]
+
+    def get_image_preview(self, obj):
+        if not obj.image:
+            return "выберите картинку"
+        return format_html(
+            '<img src="{url}" style="max-height: 200px;"/>', url=obj.image.url
+        )
+
+    get_image_preview.short_description = "превью"
+
+    def get_image_list_preview(self, obj):
+        if not obj.image:
+            return "нет картинки"
+        return format_html(
+            '<img src="{src}" style="max-height: 50px;"/>', src=obj.image.url
+        )
+
+    get_image_list_preview.short_description = "превью"
@@ -5,4 +5,5 @@ class FoodcartappConfig(AppConfig):
     default_auto_field = 'django.db.models.AutoField'
     name = 'foodcartapp'
 
-   
\ No newline at end of file
+    def ready(self):
+        from . import signals  # noqa: F401
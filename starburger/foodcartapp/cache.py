@@ -0,0 +1,113 @@
+import logging
+import time
+
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class VersionedPayloadCache:
+    """Кэш готовых (уже закодированных) ответов API, привязанный к версии данных.
+
+    Версия хранится в общем кэше и сдвигается при любом изменении исходных
+    таблиц. Ответ кладётся под ключом текущей версии, а последний собранный
+    ответ дополнительно хранится под ключом ``latest``: пока один воркер
+    пересобирает ответ под замком, остальные отдают предыдущую версию.
+    """
+
+    lock_timeout = 30
+    payload_timeout = 60 * 60 * 24
+
+    def __init__(self, name):
+        self.name = name
+        self.version_key = f"{name}:version"
+        self.bumped_at_key = f"{name}:bumped-at"
+        self.latest_key = f"{name}:latest"
+        self.lock_key = f"{name}:rebuild-lock"
+
+    def payload_key(self, version):
+        return f"{self.name}:payload:{version}"
+
+    def get_version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            # После очистки кэша неизвестно, что менялось, поэтому время
+            # последнего изменения считается текущим
+            cache.add(self.bumped_at_key, timezone.now(), timeout=None)
+            cache.add(self.version_key, time.time_ns(), timeout=None)
+            version = cache.get(self.version_key)
+        return version
+
+    def get_bumped_at(self):
+        """Когда версия сдвигалась последний раз, или ``None``, если неизвестно.
+
+        В отличие от максимума ``updated_at`` исходных таблиц, это время
+        сдвигается и при удалении строк.
+        """
+        return cache.get(self.bumped_at_key)
+
+    def bump_version(self):
+        # Время ставится раньше версии: валидаторы новой версии не должны
+        # прочитать время предыдущей
+        cache.set(self.bumped_at_key, timezone.now(), timeout=None)
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, time.time_ns(), timeout=None)
+
+    def get_or_build(self, build, timeout=None):
+        """Вернуть закодированный ответ текущей версии.
+
+        ``build`` вызывается без аргументов и возвращает ``bytes`` либо пару
+        ``(bytes, timeout)``, если срок жизни ответа зависит от данных.
+        """
+        version = self.get_version()
+        payload = cache.get(self.payload_key(version))
+        if payload is not None:
+            return payload
+
+        if not cache.add(self.lock_key, version, timeout=self.lock_timeout):
+            latest = cache.get(self.latest_key)
+            if latest is not None:
+                return latest[1]
+            payload, _ = self._build(build, timeout)
+            return payload
+
+        try:
+            payload, payload_timeout = self._build(build, timeout)
+            cache.set_many(
+                {
+                    self.payload_key(version): payload,
+                    self.latest_key: (version, payload),
+                },
+                timeout=payload_timeout,
+            )
+            logger.debug(f"Пересобран кэш {self.name} версии {version}")
+        finally:
+            cache.delete(self.lock_key)
+        return payload
+
+    def get_validators(self, compute):
+        """Вернуть пару ``(etag, last_modified)`` для текущей версии.
+
+        ``compute`` вызывается только один раз на версию данных.
+        """
+        version = self.get_version()
+        key = f"{self.name}:validators:{version}"
+        validators = cache.get(key)
+        if validators is None:
+            validators = compute()
+            cache.set(key, validators, timeout=self.payload_timeout)
+        return validators
+
+    def _build(self, build, timeout):
+        built = build()
+        if isinstance(built, tuple):
+            return built
+        return built, self.payload_timeout if timeout is None else timeout
+
+
+catalog_cache = VersionedPayloadCache("catalog")
+banners_cache = VersionedPayloadCache("banners")
+orders_cache = VersionedPayloadCache("orders")
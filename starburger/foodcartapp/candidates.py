@@ -0,0 +1,252 @@
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from geolocation.addresses import normalize_address
+from geolocation.utils import find_locations
+
+from .cache import orders_cache
+from .models import Order, OrderCandidate, OrderItem, Restaurant, RestaurantMenuItem
+from .restaurants import CapabilityIndex, RestaurantIndex
+
+logger = logging.getLogger(__name__)
+
+REFRESH_BATCH_SIZE = 500
+
+pending = threading.local()
+
+
+def get_order_points(orders):
+    """Координаты адресов доставки по ``id`` заказа; ``None``, если адрес не геокодирован."""
+    points = {order.id: order.location.point if order.location else None for order in orders}
+    missing_addresses = [order.address for order in orders if points[order.id] is None]
+    if missing_addresses:
+        locations = find_locations(missing_addresses)
+        for order in orders:
+            location = locations.get(normalize_address(order.address))
+            if points[order.id] is None and location is not None:
+                points[order.id] = location.point
+    return points
+
+
+def rank_candidates(order_point, restaurant_ids, restaurant_index, limit):
+    """Пары ``(id ресторана, расстояние)`` от ближнего ресторана к дальнему."""
+    if order_point is None:
+        return [(restaurant_id, None) for restaurant_id in sorted(restaurant_ids)][:limit]
+
+    nearest = restaurant_index.nearest(
+        order_point,
+        k=limit,
+        restaurant_ids=restaurant_ids,
+        exact=settings.DISTANCE_EXACT,
+    )
+    ranked = [(restaurant.id, round(distance, 2)) for restaurant, distance in nearest]
+    if limit is None:
+        located_ids = {restaurant_id for restaurant_id, _ in ranked}
+        ranked += [
+            (restaurant_id, None)
+            for restaurant_id in sorted(restaurant_ids)
+            if restaurant_id not in located_ids
+        ]
+    return ranked
+
+
+def refresh_order_candidates(order_ids):
+    """Пересчитать рестораны-кандидаты заказов ``order_ids``.
+
+    Кандидаты — рестораны, где в наличии все товары заказа, по возрастанию
+    расстояния до адреса доставки; без координат адреса — все такие
+    рестораны без расстояний. Меню и рестораны читаются из базы только для
+    товаров этих заказов, поэтому пересчёт не зависит от индексов в памяти
+    воркера. У завершённых заказов кандидаты удаляются. Возвращает число
+    пересчитанных активных заказов.
+    """
+    order_ids = set(order_ids)
+    if not order_ids:
+        return 0
+
+    orders = list(
+        Order.objects.active()
+        .filter(id__in=order_ids)
+        .select_related("location")
+        .prefetch_related(
+            Prefetch(
+                "items",
+                queryset=OrderItem.objects.only("order_id", "product_id"),
+                to_attr="prefetched_items",
+            )
+        )
+    )
+    product_ids_by_order = {
+        order.id: {item.product_id for item in order.prefetched_items} for order in orders
+    }
+    capability_index = CapabilityIndex(
+        RestaurantMenuItem.objects.filter(
+            availability=True,
+            product_id__in=set().union(*product_ids_by_order.values()),
+        ).values_list("restaurant_id", "product_id")
+    )
+    restaurant_ids_by_order = {
+        order_id: set(capability_index.restaurants_for(product_ids))
+        for order_id, product_ids in product_ids_by_order.items()
+    }
+    restaurant_index = RestaurantIndex(
+        Restaurant.objects.filter(
+            id__in=set().union(*restaurant_ids_by_order.values())
+        ).select_related("location")
+    )
+    order_points = get_order_points(orders)
+    limit = settings.MANAGER_PANEL_RESTAURANTS_LIMIT or None
+
+    candidates = [
+        OrderCandidate(
+            order_id=order.id,
+            restaurant_id=restaurant_id,
+            distance_km=distance,
+            rank=rank,
+        )
+        for order in orders
+        for rank, (restaurant_id, distance) in enumerate(
+            rank_candidates(
+                order_points[order.id],
+                restaurant_ids_by_order[order.id],
+                restaurant_index,
+                limit,
+            ),
+            start=1,
+        )
+    ]
+
+    now = timezone.now()
+    with transaction.atomic():
+        # Блокировка строк заказов не даёт двум пересчётам одновременно
+        # удалить и заново вставить одних и тех же кандидатов
+        list(Order.objects.select_for_update().filter(id__in=order_ids).order_by("id").values_list("id"))
+        OrderCandidate.objects.filter(order_id__in=order_ids).delete()
+        OrderCandidate.objects.bulk_create(candidates, batch_size=1000)
+        Order.objects.filter(id__in=product_ids_by_order).update(
+            candidates_updated_at=now,
+            updated_at=now,
+        )
+        transaction.on_commit(orders_cache.bump_version)
+    return len(orders)
+
+
+def schedule_candidates_refresh(order_ids):
+    """Пересчитать кандидатов заказов после коммита текущей транзакции.
+
+    Заказы копятся до коммита и пересчитываются одним проходом, сколько бы
+    раз за транзакцию их ни меняли.
+    """
+    get_pending_order_ids().update(order_ids)
+    transaction.on_commit(flush_candidates_refresh, robust=True)
+
+
+def get_pending_order_ids():
+    if not hasattr(pending, "order_ids"):
+        pending.order_ids = set()
+    return pending.order_ids
+
+
+def flush_candidates_refresh():
+    order_ids = sorted(get_pending_order_ids())
+    pending.order_ids = set()
+    for start in range(0, len(order_ids), REFRESH_BATCH_SIZE):
+        batch = order_ids[start:start + REFRESH_BATCH_SIZE]
+        try:
+            refresh_order_candidates(batch)
+        except Exception:
+            # Панель менеджера пересчитает таких кандидатов при показе заказа
+            logger.exception(f"Не удалось пересчитать рестораны для {len(batch)} заказов")
+            Order.objects.filter(id__in=batch).update(candidates_updated_at=None)
+
+
+def schedule_menu_candidates_update(menu_changes):
+    """Обновить кандидатов после того, как пункты меню стали доступны или пропали.
+
+    ``menu_changes`` — пары ``(id ресторана, id товара)``, у которых
+    поменялась доступность. Пары копятся до коммита транзакции, так что
+    массовая правка меню обрабатывается одним проходом. Вызывайте и после
+    ``QuerySet.update()`` пунктов меню: такие правки сигналов не шлют.
+    """
+    get_pending_menu_changes().update(menu_changes)
+    transaction.on_commit(flush_menu_candidates_update, robust=True)
+
+
+def get_pending_menu_changes():
+    if not hasattr(pending, "menu_changes"):
+        pending.menu_changes = set()
+    return pending.menu_changes
+
+
+def flush_menu_candidates_update():
+    menu_changes = get_pending_menu_changes()
+    pending.menu_changes = set()
+    if not menu_changes:
+        return
+    get_pending_order_ids().update(find_orders_affected_by_menu(menu_changes))
+    flush_candidates_refresh()
+
+
+def find_orders_affected_by_menu(menu_changes):
+    """Активные заказы, для которых ресторан из ``menu_changes`` стал или перестал быть кандидатом.
+
+    Заказы с изменёнными товарами ищутся по индексу позиций заказов
+    ``(product, order)``, так что работа пропорциональна числу этих
+    заказов, а не всех активных. Заказы со сброшенными кандидатами
+    пропускаются: их и так пересчитает панель.
+    """
+    changed_products_by_restaurant = defaultdict(set)
+    for restaurant_id, product_id in menu_changes:
+        changed_products_by_restaurant[restaurant_id].add(product_id)
+    changed_product_ids = {product_id for _, product_id in menu_changes}
+
+    affected_orders = OrderItem.objects.filter(
+        product_id__in=changed_product_ids,
+        order__status__in=Order.ACTIVE_STATUSES,
+        order__candidates_updated_at__isnull=False,
+    ).values("order_id")
+    product_ids_by_order = defaultdict(set)
+    for order_id, product_id in OrderItem.objects.filter(
+        order_id__in=affected_orders
+    ).values_list("order_id", "product_id"):
+        product_ids_by_order[order_id].add(product_id)
+    if not product_ids_by_order:
+        return set()
+
+    available_product_ids = defaultdict(set)
+    for restaurant_id, product_id in RestaurantMenuItem.objects.filter(
+        restaurant_id__in=changed_products_by_restaurant,
+        product_id__in=set().union(*product_ids_by_order.values()),
+        availability=True,
+    ).values_list("restaurant_id", "product_id"):
+        available_product_ids[restaurant_id].add(product_id)
+    current_candidates = set(
+        OrderCandidate.objects.filter(
+            restaurant_id__in=changed_products_by_restaurant,
+            order_id__in=affected_orders,
+        ).values_list("order_id", "restaurant_id")
+    )
+
+    affected_order_ids = set()
+    for order_id, product_ids in product_ids_by_order.items():
+        for restaurant_id, restaurant_product_ids in changed_products_by_restaurant.items():
+            if product_ids.isdisjoint(restaurant_product_ids):
+                continue
+            capable = product_ids <= available_product_ids[restaurant_id]
+            # При MANAGER_PANEL_RESTAURANTS_LIMIT подходящий ресторан может не
+            # попасть в сохранённые, такой заказ просто пересчитается заново
+            if capable != ((order_id, restaurant_id) in current_candidates):
+                affected_order_ids.add(order_id)
+                break
+    return affected_order_ids
+
+
+def mark_active_candidates_stale():
+    """Сбросить кандидатов всех активных заказов: панель пересчитает их при показе."""
+    return Order.objects.active().update(candidates_updated_at=None)
@@ -0,0 +1,85 @@
+import hashlib
+import io
+import logging
+
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_WIDTHS = (160, 320, 640)
+DERIVATIVE_FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+DERIVATIVES_DIR = "derivatives"
+
+
+def read_image_content(image_field):
+    image_field.open("rb")
+    try:
+        image_field.seek(0)
+        return image_field.read()
+    finally:
+        image_field.close()
+
+
+def build_image_derivatives(image_field):
+    """Нарезать картинку на несколько ширин в WebP и JPEG.
+
+    Файлы называются по хэшу исходника, поэтому повторная загрузка той же
+    картинки не создаёт новых файлов. Возвращает описание для
+    ``Product.image_derivatives``.
+    """
+    content = read_image_content(image_field)
+    digest = hashlib.sha256(content).hexdigest()[:16]
+    storage = image_field.storage
+
+    with Image.open(io.BytesIO(content)) as original:
+        original = ImageOps.exif_transpose(original).convert("RGB")
+        widths = [width for width in DERIVATIVE_WIDTHS if width < original.width]
+        widths.append(min(original.width, DERIVATIVE_WIDTHS[-1]))
+
+        derivatives = {"source": image_field.name}
+        for width in sorted(set(widths)):
+            height = round(original.height * width / original.width)
+            resized = original.resize((width, height), Image.LANCZOS)
+            for extension, (image_format, save_options) in DERIVATIVE_FORMATS.items():
+                name = f"{DERIVATIVES_DIR}/{digest}-{width}w.{extension}"
+                if not storage.exists(name):
+                    buffer = io.BytesIO()
+                    resized.save(buffer, image_format, **save_options)
+                    name = storage.save(name, ContentFile(buffer.getvalue()))
+                derivatives.setdefault(extension, []).append(
+                    {"width": width, "name": name}
+                )
+    return derivatives
+
+
+def refresh_image_derivatives(product):
+    """Пересобрать производные, если картинка товара поменялась."""
+    if not product.image:
+        derivatives = {}
+    elif product.image_derivatives.get("source") == product.image.name:
+        return False
+    else:
+        try:
+            derivatives = build_image_derivatives(product.image)
+        except (OSError, UnidentifiedImageError) as e:
+            logger.error(f"Не удалось нарезать картинку товара {product.pk}: {e}")
+            return False
+
+    type(product).objects.filter(pk=product.pk).update(
+        image_derivatives=derivatives,
+        updated_at=timezone.now(),
+    )
+    product.image_derivatives = derivatives
+    return True
+
+
+def build_srcset(storage, derivatives, extension):
+    return ", ".join(
+        f"{storage.url(item['name'])} {item['width']}w"
+        for item in derivatives.get(extension, [])
+    )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.cache import catalog_cache
+from foodcartapp.images import refresh_image_derivatives
+from foodcartapp.models import Product
+
+
+class Command(BaseCommand):
+    help = "Нарезает уменьшенные копии картинок товаров, у которых их ещё нет"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="пересобрать копии для всех товаров",
+        )
+
+    def handle(self, *args, force=False, **options):
+        refreshed = 0
+        for product in Product.objects.exclude(image="").iterator():
+            if force:
+                product.image_derivatives = {}
+            if refresh_image_derivatives(product):
+                refreshed += 1
+        if refreshed:
+            catalog_cache.bump_version()
+        self.stdout.write(self.style.SUCCESS(f"Обновлено товаров: {refreshed}"))
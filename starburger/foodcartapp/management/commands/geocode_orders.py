@@ -0,0 +1,83 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from foodcartapp.cache import orders_cache
+from foodcartapp.candidates import schedule_candidates_refresh
+from foodcartapp.models import Order
+from geolocation.geocoders import geocoder_available
+from geolocation.utils import fetch_coordinates, find_location
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Определяет координаты заказов, принятых без геокодирования"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="работать постоянно, опрашивая очередь заказов",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="пауза между опросами очереди в секундах",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50,
+            help="сколько заказов обрабатывать за один проход",
+        )
+
+    def handle(self, *args, loop=False, interval=5, batch_size=50, **options):
+        while True:
+            processed = self.geocode_pending_orders(batch_size)
+            if processed:
+                self.stdout.write(f"Обработано заказов: {processed}")
+            if not loop:
+                break
+            if processed < batch_size:
+                time.sleep(interval)
+
+    def geocode_pending_orders(self, batch_size):
+        orders = list(
+            Order.objects.due_for_geocoding(timezone.now())
+            .order_by("created_at")
+            .values_list("id", "address", "geocoding_status", "location_id")[:batch_size]
+        )
+        for processed, (order_id, address, status, location_id) in enumerate(orders):
+            if not geocoder_available():
+                logger.warning("Геокодер недоступен, заказы подождут следующего прохода")
+                return processed
+            fetch_coordinates(address)
+            location = find_location(address)
+
+            # Окончательно не найденным адрес считается, только если так ответил
+            # геокодер. После сетевой ошибки заказ ждёт следующей попытки, а
+            # ненайденный адрес перепроверяется, когда наступит next_retry_at
+            if location and location.has_coordinates():
+                new_status = "done"
+            elif location and location.geocode_error == "not_found":
+                new_status = "failed"
+            else:
+                new_status = "pending"
+            new_location_id = location.id if location else None
+            if (new_status, new_location_id) == (status, location_id):
+                continue
+
+            Order.objects.filter(id=order_id, geocoding_status=status).update(
+                location=location,
+                updated_at=timezone.now(),
+                geocoding_status=new_status,
+            )
+            orders_cache.bump_version()
+            schedule_candidates_refresh([order_id])
+            if new_status == "failed":
+                logger.warning(f"Не удалось геокодировать заказ {order_id}: {address}")
+        return len(orders)
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.candidates import mark_active_candidates_stale
+from foodcartapp.models import Restaurant
+from geolocation.addresses import normalize_address
+from geolocation.utils import find_locations, geocode_many
+
+
+class Command(BaseCommand):
+    help = "Привязывает рестораны к геоточкам их адресов, геокодируя новые адреса"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Перепривязать все рестораны, а не только те, у которых нет геоточки",
+        )
+
+    def handle(self, *args, **options):
+        restaurants = Restaurant.objects.select_related("location")
+        if not options["all"]:
+            restaurants = restaurants.filter(location__isnull=True)
+        restaurants = list(restaurants)
+        if not restaurants:
+            self.stdout.write("Все рестораны уже привязаны к геоточкам")
+            return
+
+        addresses = {restaurant.address for restaurant in restaurants}
+        geocode_many(addresses)
+        locations = find_locations(addresses)
+
+        for restaurant in restaurants:
+            restaurant.location = locations.get(normalize_address(restaurant.address))
+        Restaurant.objects.bulk_update(restaurants, ["location"])
+        mark_active_candidates_stale()
+
+        located = [
+            restaurant
+            for restaurant in restaurants
+            if restaurant.location and restaurant.location.has_coordinates()
+        ]
+        self.stdout.write(
+            self.style.SUCCESS(f"Привязано ресторанов: {len(located)} из {len(restaurants)}")
+        )
+        for restaurant in restaurants:
+            if restaurant not in located:
+                self.stderr.write(f"Нет координат для «{restaurant.name}»: {restaurant.address}")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from foodcartapp.cache import catalog_cache
+from foodcartapp.models import Product
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает наличие товаров по пунктам меню ресторанов"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated = Product.objects.rebuild_availability()
+        catalog_cache.bump_version()
+        available = Product.objects.available().count()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Пересчитано товаров: {updated}, в наличии: {available}"
+            )
+        )
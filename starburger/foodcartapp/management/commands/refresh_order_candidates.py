@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.candidates import REFRESH_BATCH_SIZE, refresh_order_candidates
+from foodcartapp.models import Order
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает рестораны, которые могут приготовить активные заказы"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Пересчитать все активные заказы, а не только те, где кандидаты сброшены",
+        )
+
+    def handle(self, *args, **options):
+        orders = Order.objects.active()
+        if not options["all"]:
+            orders = orders.with_stale_candidates()
+        order_ids = list(orders.order_by("id").values_list("id", flat=True))
+        if not order_ids:
+            self.stdout.write("Рестораны для всех активных заказов уже посчитаны")
+            return
+
+        refreshed = 0
+        for start in range(0, len(order_ids), REFRESH_BATCH_SIZE):
+            refreshed += refresh_order_candidates(order_ids[start:start + REFRESH_BATCH_SIZE])
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано заказов: {refreshed}"))
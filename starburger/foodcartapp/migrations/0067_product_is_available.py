@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:56
+
+from django.db import migrations, models
+from django.db.models import Count, Exists, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_product_availability(apps, schema_editor):
+    Product = apps.get_model('foodcartapp', 'Product')
+    RestaurantMenuItem = apps.get_model('foodcartapp', 'RestaurantMenuItem')
+
+    available_menu_items = RestaurantMenuItem.objects.filter(
+        product=OuterRef('pk'), availability=True
+    )
+    counts = (
+        available_menu_items.order_by()
+        .values('product')
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    Product.objects.update(
+        available_restaurants_count=Coalesce(Subquery(counts), 0),
+        is_available=Exists(available_menu_items),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0066_alter_orderitem_fixed_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='available_restaurants_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='ресторанов в наличии'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='is_available',
+            field=models.BooleanField(db_index=True, default=False, editable=False, verbose_name='в наличии'),
+        ),
+        migrations.RunPython(fill_product_availability, reverse_code=migrations.RunPython.noop),
+    ]
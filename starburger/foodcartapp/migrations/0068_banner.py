@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:57
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+DEFAULT_BANNERS = [
+    ('Burger', 'burger.jpg', 'Tasty Burger at your door step'),
+    ('Spices', 'food.jpg', 'All Cuisines'),
+    ('New York', 'tasty.jpg', 'Food is incomplete without a tasty dessert'),
+]
+
+
+def create_default_banners(apps, schema_editor):
+    Banner = apps.get_model('foodcartapp', 'Banner')
+    if Banner.objects.exists():
+        return
+
+    for position, (title, filename, text) in enumerate(DEFAULT_BANNERS):
+        path = settings.BASE_DIR / 'assets' / filename
+        if not path.exists():
+            continue
+        # Картинка из прошлого прогона миграций (например, тестовой базы)
+        # переиспользуется, а не копируется в MEDIA_ROOT под новым именем
+        image_name = f'banners/{filename}'
+        if not default_storage.exists(image_name):
+            with path.open('rb') as image:
+                image_name = default_storage.save(image_name, File(image))
+        Banner.objects.create(
+            title=title,
+            text=text,
+            image=image_name,
+            position=position,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0067_product_is_available'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Banner',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=50, verbose_name='заголовок')),
+                ('text', models.CharField(blank=True, max_length=200, verbose_name='текст')),
+                ('image', models.ImageField(upload_to='banners', verbose_name='картинка')),
+                ('position', models.PositiveIntegerField(db_index=True, default=0, verbose_name='порядок')),
+                ('is_active', models.BooleanField(db_index=True, default=True, verbose_name='показывать')),
+                ('active_from', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='показывать с')),
+                ('active_until', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='показывать до')),
+            ],
+            options={
+                'verbose_name': 'баннер',
+                'verbose_name_plural': 'баннеры',
+                'ordering': ['position', 'id'],
+            },
+        ),
+        migrations.RunPython(create_default_banners, reverse_code=migrations.RunPython.noop),
+    ]
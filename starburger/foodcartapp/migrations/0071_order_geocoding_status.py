@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0070_catalog_updated_at'),
+        ('geolocation', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='geocoding_status',
+            field=models.CharField(choices=[('done', 'Координаты определены'), ('pending', 'Ожидает геокодирования'), ('failed', 'Адрес не найден')], db_index=True, default='done', max_length=7, verbose_name='Геокодирование'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='location',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='geolocation.location', verbose_name='Координаты адреса доставки'),
+        ),
+    ]
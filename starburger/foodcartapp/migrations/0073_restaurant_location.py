@@ -0,0 +1,81 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:16
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+NORMALIZED_ADDRESS_MAX_LENGTH = 255
+
+# Копия geolocation.addresses.normalize_address на момент миграции: ключи
+# геоточек здесь ещё посчитаны по правилам geolocation.0003, а её правки
+# не должны менять то, что делает эта миграция
+ABBREVIATIONS = {
+    "г": "город",
+    "гор": "город",
+    "обл": "область",
+    "р-н": "район",
+    "мкр": "микрорайон",
+    "мкрн": "микрорайон",
+    "ул": "улица",
+    "пр": "проспект",
+    "пр-т": "проспект",
+    "просп": "проспект",
+    "пер": "переулок",
+    "пл": "площадь",
+    "б-р": "бульвар",
+    "бул": "бульвар",
+    "ш": "шоссе",
+    "наб": "набережная",
+    "д": "дом",
+    "к": "корпус",
+    "корп": "корпус",
+    "стр": "строение",
+    "кв": "квартира",
+}
+
+TOKEN_RE = re.compile(r"\w+(?:-\w+)*")
+
+
+def normalize_address(address):
+    if not address:
+        return ""
+    address = address.casefold().replace("ё", "е")
+    words = []
+    for token in TOKEN_RE.findall(address):
+        if token in ABBREVIATIONS:
+            words.append(ABBREVIATIONS[token])
+        else:
+            words.extend(token.split("-"))
+    return " ".join(words)[:NORMALIZED_ADDRESS_MAX_LENGTH]
+
+
+def link_restaurant_locations(apps, schema_editor):
+    Restaurant = apps.get_model('foodcartapp', 'Restaurant')
+    Location = apps.get_model('geolocation', 'Location')
+
+    restaurants = list(Restaurant.objects.all())
+    locations = Location.objects.in_bulk(
+        {normalize_address(restaurant.address) for restaurant in restaurants},
+        field_name='normalized_address',
+    )
+    for restaurant in restaurants:
+        restaurant.location = locations.get(normalize_address(restaurant.address))
+    Restaurant.objects.bulk_update(restaurants, ['location'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0072_idempotencykey'),
+        ('geolocation', '0003_location_normalized_address'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='location',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='restaurants', to='geolocation.location', verbose_name='Координаты адреса'),
+        ),
+        migrations.RunPython(link_restaurant_locations, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-17 10:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0077_orderitem_product_order_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now, verbose_name='изменён'),
+            preserve_default=False,
+        ),
+    ]
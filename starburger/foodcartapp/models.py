@@ -1,10 +1,19 @@
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import models
-from django.db.models import Sum, F, Prefetch
+from django.db.models import Sum, F, Prefetch, Case, When, Count, Exists, OuterRef, Subquery
+from django.db.models import Q, Min
+from django.db.models.functions import Coalesce
 from django.db.models.query import QuerySet
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 from phonenumber_field.modelfields import PhoneNumberField
 from collections import defaultdict
 
+from .images import DERIVATIVE_FORMATS, build_srcset
+
 
 class OrderQuerySet(QuerySet):
     def with_total_price(self):
@@ -13,24 +22,60 @@ class OrderQuerySet(QuerySet):
         )
 
     def active(self):
-        return self.filter(status__in=["un", "pr", "sh"])
+        return self.filter(status__in=Order.ACTIVE_STATUSES)
+
+    def pending_geocoding(self):
+        return self.filter(geocoding_status="pending")
+
+    def due_for_geocoding(self, now):
+        """Заказы, адрес которых пора геокодировать: ожидающие и ненайденные.
+
+        Заказ ждёт, пока у геоточки его адреса не наступит ``next_retry_at``.
+        """
+        retry_due = (
+            Q(location__isnull=True)
+            | Q(location__next_retry_at__isnull=True)
+            | Q(location__next_retry_at__lte=now)
+        )
+        return self.filter(
+            Q(geocoding_status="pending") | Q(geocoding_status="failed"),
+            retry_due,
+        )
 
     def for_manager_panel(self):
+        return self.active().with_panel_data().order_by("-created_at", "-id")
+
+    def with_panel_data(self):
         return (
-            self.active()
-            .with_total_price()
+            self.with_total_price()
             .select_related(
                 "cooking_restaurant",
+                "location",
             )
             .prefetch_related(
                 Prefetch(
-                    "items",
-                    queryset=OrderItem.objects.select_related("product"),
-                    to_attr="prefetched_items",
+                    "candidates",
+                    queryset=OrderCandidate.objects.select_related("restaurant").order_by("rank"),
+                    to_attr="prefetched_candidates",
                 ),
             )
         )
 
+    def with_stale_candidates(self):
+        return self.filter(candidates_updated_at__isnull=True)
+
+    def changed_after(self, updated_at, order_id):
+        """Заказы, изменённые после ``(updated_at, id)``, от старых изменений к новым."""
+        return self.filter(
+            Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=order_id)
+        ).order_by("updated_at", "id")
+
+    def after_cursor(self, created_at, order_id):
+        """Заказы, идущие после ``(created_at, id)`` при сортировке от новых к старым."""
+        return self.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=order_id)
+        )
+
 
 class OrderManager(models.Manager):
     def get_queryset(self):
@@ -42,43 +87,20 @@ class OrderManager(models.Manager):
     def with_total_price(self):
         return self.get_queryset().with_total_price()
 
-    def for_manager_panel(self):
-        orders = list(self.get_queryset().for_manager_panel().order_by("-created_at"))
-
-        if not orders:
-            return orders
-
-        menu_items = list(
-            RestaurantMenuItem.objects.filter(availability=True)
-            .select_related("restaurant")
-            .values("restaurant_id", "product_id")
-        )
-
-        restaurant_products = defaultdict(set)
-        for item in menu_items:
-            restaurant_products[item["restaurant_id"]].add(item["product_id"])
-
-        restaurant_ids = restaurant_products.keys()
-        restaurants_by_id = {
-            restaurant.id: restaurant for restaurant in Restaurant.objects.filter(id__in=restaurant_ids)
-        }
-
-        for order in orders:
-            order_items = getattr(order, "prefetched_items", [])
-            if not order_items:
-                order.available_restaurants = []
-                continue
+    def pending_geocoding(self):
+        return self.get_queryset().pending_geocoding()
 
-            order_product_ids = {item.product_id for item in order_items}
+    def due_for_geocoding(self, now):
+        return self.get_queryset().due_for_geocoding(now)
 
-            available = []
-            for rest_id, available_product_ids in restaurant_products.items():
-                if order_product_ids.issubset(available_product_ids):
-                    available.append(restaurants_by_id[rest_id])
+    def for_manager_panel(self):
+        return self.get_queryset().for_manager_panel()
 
-            order.available_restaurants = available
+    def with_panel_data(self):
+        return self.get_queryset().with_panel_data()
 
-        return orders
+    def with_stale_candidates(self):
+        return self.get_queryset().with_stale_candidates()
 
 
 class Restaurant(models.Model):
@@ -87,25 +109,64 @@ class Restaurant(models.Model):
     contact_phone = models.CharField(
         "контактный телефон", max_length=50, blank=True, db_index=True
     )
+    location = models.ForeignKey(
+        "geolocation.Location",
+        verbose_name="Координаты адреса",
+        related_name="restaurants",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    updated_at = models.DateTimeField("изменён", auto_now=True, db_index=True)
 
     class Meta:
         verbose_name = "ресторан"
         verbose_name_plural = "рестораны"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if "location_id" in instance.__dict__:
+            instance.loaded_location_id = instance.location_id
+        return instance
+
     def __str__(self):
         return self.name
 
 
 class ProductQuerySet(models.QuerySet):
     def available(self):
-        products = RestaurantMenuItem.objects.filter(availability=True).values_list(
-            "product"
+        return self.filter(is_available=True)
+
+    def shift_available_restaurants_count(self, delta):
+        return self.update(
+            available_restaurants_count=F("available_restaurants_count") + delta,
+            is_available=Case(
+                When(available_restaurants_count__gt=-delta, then=True),
+                default=False,
+            ),
+        )
+
+    def rebuild_availability(self):
+        available_menu_items = RestaurantMenuItem.objects.filter(
+            product=OuterRef("pk"), availability=True
+        )
+        counts = (
+            available_menu_items.order_by()
+            .values("product")
+            .annotate(count=Count("pk"))
+            .values("count")
+        )
+        return self.update(
+            available_restaurants_count=Coalesce(Subquery(counts), 0),
+            is_available=Exists(available_menu_items),
         )
-        return self.filter(pk__in=products)
 
 
 class ProductCategory(models.Model):
     name = models.CharField("название", max_length=50)
+    updated_at = models.DateTimeField("изменена", auto_now=True, db_index=True)
 
     class Meta:
         verbose_name = "категория"
@@ -139,13 +200,65 @@ class Product(models.Model):
         max_length=200,
         blank=True,
     )
+    is_available = models.BooleanField(
+        "в наличии",
+        default=False,
+        editable=False,
+        db_index=True,
+    )
+    available_restaurants_count = models.PositiveIntegerField(
+        "ресторанов в наличии",
+        default=0,
+        editable=False,
+    )
+    image_derivatives = models.JSONField(
+        "уменьшенные копии картинки",
+        default=dict,
+        blank=True,
+        editable=False,
+    )
+    updated_at = models.DateTimeField("изменён", auto_now=True, db_index=True)
 
     objects = ProductQuerySet.as_manager()
 
+    # Эти поля меняют только атомарные UPDATE из сигналов пунктов меню
+    availability_fields = {"is_available", "available_restaurants_count"}
+
     class Meta:
         verbose_name = "товар"
         verbose_name_plural = "товары"
 
+    def save(self, *args, update_fields=None, **kwargs):
+        # Иначе сохранение товара, загруженного до переключения пункта меню,
+        # вернуло бы в базу устаревшие счётчики наличия
+        if not self._state.adding:
+            if update_fields is None:
+                update_fields = [
+                    field.name
+                    for field in self._meta.concrete_fields
+                    if not field.primary_key
+                ]
+            update_fields = [
+                field_name
+                for field_name in update_fields
+                if field_name not in self.availability_fields
+            ]
+        super().save(*args, update_fields=update_fields, **kwargs)
+
+    def get_image_srcset(self):
+        return {
+            extension: build_srcset(self.image.storage, self.image_derivatives, extension)
+            for extension in DERIVATIVE_FORMATS
+            if self.image_derivatives.get(extension)
+        }
+
+    def get_image_thumbnail_url(self, min_width):
+        """Самая маленькая JPEG-копия не уже ``min_width``, иначе оригинал."""
+        for item in self.image_derivatives.get("jpeg", []):
+            if item["width"] >= min_width:
+                return self.image.storage.url(item["name"])
+        return self.image.url
+
     def available_restaurants(self):
         return Restaurant.objects.filter(
             menu_items__product=self, menu_items__availability=True
@@ -155,6 +268,23 @@ class Product(models.Model):
         return f"{self.name} - {self.price}"
 
 
+class RestaurantMenuItemQuerySet(models.QuerySet):
+    def available_restaurants_by_product(self, product_ids=None):
+        menu_items = self.filter(availability=True)
+        if product_ids is not None:
+            menu_items = menu_items.filter(product_id__in=product_ids)
+        rows = menu_items.order_by("product_id", "restaurant__name").values_list(
+            "product_id", "restaurant_id", "restaurant__name"
+        )
+
+        restaurants_by_product = defaultdict(list)
+        for product_id, restaurant_id, restaurant_name in rows:
+            restaurants_by_product[product_id].append(
+                {"id": restaurant_id, "name": restaurant_name}
+            )
+        return restaurants_by_product
+
+
 class RestaurantMenuItem(models.Model):
     restaurant = models.ForeignKey(
         Restaurant,
@@ -169,16 +299,71 @@ class RestaurantMenuItem(models.Model):
         verbose_name="продукт",
     )
     availability = models.BooleanField("в продаже", default=False, db_index=True)
+    updated_at = models.DateTimeField("изменён", auto_now=True, db_index=True)
+
+    objects = RestaurantMenuItemQuerySet.as_manager()
 
     class Meta:
         verbose_name = "пункт меню ресторана"
         verbose_name_plural = "пункты меню ресторана"
         unique_together = [["restaurant", "product"]]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if "product_id" in instance.__dict__ and "availability" in instance.__dict__:
+            instance.loaded_availability = (instance.product_id, instance.availability)
+        if "restaurant_id" in instance.__dict__:
+            instance.loaded_restaurant_id = instance.restaurant_id
+        return instance
+
     def __str__(self):
         return f"{self.restaurant.name} - {self.product.name}"
 
 
+class BannerQuerySet(models.QuerySet):
+    def active(self, now):
+        return self.filter(
+            Q(active_from__isnull=True) | Q(active_from__lte=now),
+            Q(active_until__isnull=True) | Q(active_until__gt=now),
+            is_active=True,
+        )
+
+    def next_schedule_change(self, now):
+        """Ближайший момент, когда набор активных баннеров поменяется сам."""
+        boundaries = self.filter(is_active=True).aggregate(
+            next_start=Min("active_from", filter=Q(active_from__gt=now)),
+            next_end=Min("active_until", filter=Q(active_until__gt=now)),
+        )
+        upcoming = [moment for moment in boundaries.values() if moment]
+        return min(upcoming) if upcoming else None
+
+
+class Banner(models.Model):
+    title = models.CharField("заголовок", max_length=50)
+    text = models.CharField("текст", max_length=200, blank=True)
+    image = models.ImageField("картинка", upload_to="banners")
+    position = models.PositiveIntegerField("порядок", default=0, db_index=True)
+    is_active = models.BooleanField("показывать", default=True, db_index=True)
+    active_from = models.DateTimeField(
+        "показывать с", null=True, blank=True, db_index=True
+    )
+    active_until = models.DateTimeField(
+        "показывать до", null=True, blank=True, db_index=True
+    )
+    updated_at = models.DateTimeField("изменён", auto_now=True, db_index=True)
+
+    objects = BannerQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "баннер"
+        verbose_name_plural = "баннеры"
+        ordering = ["position", "id"]
+
+    def __str__(self):
+        return self.title
+
+
 class Order(models.Model):
     ORDER_STATUSES = {
         "un": "Необработан",
@@ -186,11 +371,17 @@ class Order(models.Model):
         "sh": "Отправлен",
         "dl": "Доставлен",
     }
+    ACTIVE_STATUSES = ["un", "pr", "sh"]
     PAYMENT_TYPES = {
         "nstd": "Не установлен",
         "epay": "Электронно",
         "cash": "Наличными",
     }
+    GEOCODING_STATUSES = {
+        "done": "Координаты определены",
+        "pending": "Ожидает геокодирования",
+        "failed": "Адрес не найден",
+    }
     firstname = models.CharField(
         max_length=100, verbose_name="Имя", null=False, blank=False
     )
@@ -201,9 +392,28 @@ class Order(models.Model):
         verbose_name="Телефон", help_text="В формате +7 XXX XXX-XX-XX"
     )
     address = models.TextField(verbose_name="Адрес", null=False, blank=False)
+    location = models.ForeignKey(
+        "geolocation.Location",
+        verbose_name="Координаты адреса доставки",
+        related_name="orders",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    geocoding_status = models.CharField(
+        max_length=7,
+        choices=GEOCODING_STATUSES,
+        default="done",
+        verbose_name="Геокодирование",
+        db_index=True,
+    )
     created_at = models.DateTimeField(
         auto_now_add=True, verbose_name="Создан", db_index=True
     )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Изменён")
+    candidates_updated_at = models.DateTimeField(
+        verbose_name="Рестораны пересчитаны", null=True, blank=True, editable=False
+    )
     called_at = models.DateTimeField(
         editable=True, verbose_name="Время звонка", null=True, blank=True, db_index=True
     )
@@ -244,6 +454,10 @@ class Order(models.Model):
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="order_created_at_id_idx"),
+            models.Index(fields=["updated_at", "id"], name="order_updated_at_id_idx"),
+        ]
 
     def __str__(self):
         return f"Заказ {self.id} от {self.firstname} {self.lastname} {self.phonenumber}"
@@ -260,6 +474,7 @@ class OrderItem(models.Model):
         verbose_name="Продукт",
         related_name="order_items",
         on_delete=models.CASCADE,
+        db_index=False,
     )
 
     quantity = models.PositiveIntegerField(
@@ -281,6 +496,63 @@ class OrderItem(models.Model):
         verbose_name = "позиция в заказе"
         verbose_name_plural = "позиции в заказе"
         unique_together = [["order", "product"]]
+        indexes = [
+            models.Index(fields=["product", "order"], name="orderitem_product_order_idx"),
+        ]
 
     def __str__(self):
         return f"{self.product.name} x {self.quantity} (заказ #{self.order.id})"
+
+
+class OrderCandidate(models.Model):
+    order = models.ForeignKey(
+        Order, verbose_name="Заказ", related_name="candidates", on_delete=models.CASCADE
+    )
+    restaurant = models.ForeignKey(
+        Restaurant,
+        verbose_name="Ресторан",
+        related_name="order_candidates",
+        on_delete=models.CASCADE,
+    )
+    distance_km = models.FloatField(
+        verbose_name="Расстояние, км", null=True, blank=True
+    )
+    rank = models.PositiveIntegerField(verbose_name="Место по удалённости")
+
+    class Meta:
+        verbose_name = "ресторан для заказа"
+        verbose_name_plural = "рестораны для заказов"
+        unique_together = [["order", "restaurant"]]
+        indexes = [
+            models.Index(fields=["order", "rank"], name="ordercandidate_order_rank_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.restaurant.name} для заказа #{self.order_id}"
+
+
+class IdempotencyKeyQuerySet(models.QuerySet):
+    def expired(self):
+        ttl = timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+        return self.filter(created_at__lt=timezone.now() - ttl)
+
+
+class IdempotencyKey(models.Model):
+    key_hash = models.CharField("хэш ключа", max_length=64, unique=True)
+    request_hash = models.CharField("хэш тела запроса", max_length=64)
+    response_status = models.PositiveSmallIntegerField("код ответа", null=True)
+    response_body = models.TextField("тело ответа", blank=True)
+    created_at = models.DateTimeField("создан", auto_now_add=True, db_index=True)
+
+    objects = IdempotencyKeyQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "ключ идемпотентности"
+        verbose_name_plural = "ключи идемпотентности"
+
+    def __str__(self):
+        return self.key_hash
+
+    @staticmethod
+    def make_hash(value):
+        return hashlib.sha256(value).hexdigest()
@@ -0,0 +1,46 @@
+import base64
+import json
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(*values):
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor, size):
+    """Разобрать курсор keyset-пагинации в кортеж из ``size`` значений."""
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("Некорректный курсор") from e
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor("Некорректный курсор")
+    return tuple(values)
+
+
+def cursor_id(value):
+    """Проверить ``id`` из курсора: только целое в пределах ``bigint``.
+
+    ``bool``, дробные числа, ``Infinity`` и строки — признак подделанного
+    курсора, а не значения, которое стоит приводить к ``int``.
+    """
+    if isinstance(value, bool) or not isinstance(value, int) or not 0 <= value < 2 ** 63:
+        raise InvalidCursor("Некорректный курсор")
+    return value
+
+
+def parse_limit(value, default, maximum):
+    if not value:
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError("limit должен быть целым числом")
+    if limit < 1:
+        raise ValueError("limit должен быть положительным")
+    return min(limit, maximum)
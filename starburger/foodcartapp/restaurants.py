@@ -0,0 +1,91 @@
+from collections import defaultdict
+
+import numpy as np
+
+from geolocation.spatial import GridIndex
+from geolocation.utils import fetch_coordinates, find_location
+
+
+class CapabilityIndex:
+    """Какие рестораны могут приготовить какие товары.
+
+    Для каждого товара хранится битовая маска ресторанов, где он в наличии:
+    бит с номером ``n`` — ресторан ``restaurant_ids[n]``. Рестораны для
+    заказа — пересечение масок его товаров, от самой короткой к длинной.
+    Индекс строится на один пересчёт и только по пунктам меню товаров
+    пересчитываемых заказов, поэтому между запросами не хранится.
+    """
+
+    def __init__(self, menu_items):
+        """``menu_items`` — пары ``(ресторан, товар)`` для товаров в наличии."""
+        menu_items = list(menu_items)
+        self.restaurant_ids = sorted({restaurant_id for restaurant_id, _ in menu_items})
+        bits = {
+            restaurant_id: 1 << position
+            for position, restaurant_id in enumerate(self.restaurant_ids)
+        }
+        masks = defaultdict(int)
+        for restaurant_id, product_id in menu_items:
+            masks[product_id] |= bits[restaurant_id]
+        self.masks = dict(masks)
+        self.mask_bytes = (len(self.restaurant_ids) + 7) // 8
+        self.restaurant_ids = np.array(self.restaurant_ids, dtype=np.int64)
+
+    def restaurants_for(self, product_ids):
+        """Идентификаторы ресторанов, где в наличии все товары из ``product_ids``."""
+        product_ids = set(product_ids)
+        if not product_ids or not product_ids <= self.masks.keys():
+            return ()
+        masks = sorted((self.masks[product_id] for product_id in product_ids), key=int.bit_count)
+        matched = masks[0]
+        for mask in masks[1:]:
+            matched &= mask
+            if not matched:
+                return ()
+
+        bits = np.unpackbits(
+            np.frombuffer(matched.to_bytes(self.mask_bytes, "little"), dtype=np.uint8),
+            bitorder="little",
+        )
+        return tuple(self.restaurant_ids[np.flatnonzero(bits)].tolist())
+
+
+def locate_restaurant(restaurant):
+    """Привязать ресторан к геоточке его адреса, при необходимости геокодировав адрес.
+
+    Возвращает ``True``, если координаты адреса известны.
+    """
+    location = find_location(restaurant.address)
+    if location is None or not location.has_coordinates():
+        if fetch_coordinates(restaurant.address):
+            location = find_location(restaurant.address)
+    restaurant.location = location
+    return location is not None and location.has_coordinates()
+
+
+class RestaurantIndex:
+    """Рестораны с координатами в пространственном индексе."""
+
+    def __init__(self, restaurants):
+        self.restaurants_by_id = {restaurant.id: restaurant for restaurant in restaurants}
+        self.grid = GridIndex({
+            restaurant.id: restaurant.location.point if restaurant.location else None
+            for restaurant in restaurants
+        })
+
+    def nearest(self, point, k=None, radius_km=None, restaurant_ids=None, exact=False):
+        """Ближайшие к ``point`` рестораны: список пар ``(ресторан, расстояние в км)``.
+
+        ``restaurant_ids`` оставляет только перечисленные рестораны.
+        """
+        found = self.grid.nearest(
+            point,
+            k=k,
+            radius_km=radius_km,
+            candidate_ids=restaurant_ids,
+            exact=exact,
+        )
+        return [
+            (self.restaurants_by_id[restaurant_id], distance)
+            for restaurant_id, distance in found
+        ]
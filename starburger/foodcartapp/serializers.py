@@ -1,9 +1,11 @@
 from rest_framework import serializers
 from .models import Order, OrderItem, Product
-from geolocation.models import Location
+from geolocation.addresses import normalize_address
 from phonenumber_field.phonenumber import PhoneNumber
+from django.conf import settings
 from django.db import transaction
-from geolocation.utils import fetch_coordinates
+from geolocation.geocoders import geocoder_available
+from geolocation.utils import fetch_coordinates, find_location
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -13,8 +15,41 @@ class ProductSerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "name", "price"]
 
 
+def collect_product_ids(order_data):
+    """Id товаров из сырых данных заказа, чтобы загрузить их одним запросом."""
+    product_ids = set()
+    if not isinstance(order_data, dict) or not isinstance(order_data.get("products"), list):
+        return product_ids
+    for item in order_data["products"]:
+        if not isinstance(item, dict):
+            continue
+        try:
+            product_ids.add(int(item.get("product")))
+        except (TypeError, ValueError):
+            continue
+    return product_ids
+
+
+class PrefetchedProductField(serializers.PrimaryKeyRelatedField):
+    """Берёт товары из ``context["products_by_id"]``, если они загружены заранее.
+
+    Товары, которых нет в словаре, ищутся в базе как обычно.
+    """
+
+    def to_internal_value(self, data):
+        products_by_id = self.context.get("products_by_id") or {}
+        if not isinstance(data, bool):
+            try:
+                product = products_by_id.get(int(data))
+            except (TypeError, ValueError):
+                product = None
+            if product is not None:
+                return product
+        return super().to_internal_value(data)
+
+
 class OrderItemCreateSerializer(serializers.ModelSerializer):
-    product = serializers.PrimaryKeyRelatedField(
+    product = PrefetchedProductField(
         queryset=Product.objects.all(), source="product_id", write_only=True
     )
 
@@ -50,16 +85,31 @@ class OrderCreateSerializer(serializers.ModelSerializer):
     def validate_products(self, value):
         if not value:
             raise serializers.ValidationError("Заказ должен содержать хотя бы один товар")
+        product_ids = [item["product_id"].id for item in value]
+        if len(set(product_ids)) != len(product_ids):
+            raise serializers.ValidationError(
+                "Каждый товар указывается один раз, количество — в поле quantity"
+            )
         return value
     
     def validate(self, data):
         address = str(data["address"]).strip()
         if not address:
             raise serializers.ValidationError({"address": "Адрес не может быть пустым"})
+        data["address"] = address
 
-        location = Location.objects.filter(address__iexact=address).first()
-        if location and location.latitude is not None and location.longitude is not None:
-            data["_location_cache"] = location
+        locations_by_address = self.context.get("locations_by_address")
+        if locations_by_address is not None:
+            location = locations_by_address.get(normalize_address(address))
+        else:
+            location = find_location(address)
+        if location and location.has_coordinates():
+            data["_location"] = location
+            return data
+
+        defer_geocoding = self.context.get("defer_geocoding", settings.GEOCODE_ORDERS_ASYNC)
+        if defer_geocoding or not geocoder_available():
+            data["_location"] = None
             return data
 
         coords = fetch_coordinates(address)
@@ -68,46 +118,39 @@ class OrderCreateSerializer(serializers.ModelSerializer):
                 "address": "Не удалось определить координаты по адресу. Укажите точный адрес."
             })
 
-        data["_location_cache"] = None  
-        data["_coordinates"] = coords
-        data["address"] = address 
+        data["_location"] = find_location(address)
         return data
 
-    @transaction.atomic
-    def create(self, validated_data):
-        validated_data.pop("_location_cache", None)
-        validated_data.pop("_coordinates", None)
+    def build_order(self, validated_data):
+        """Собрать несохранённые заказ и его позиции из проверенных данных."""
+        validated_data = dict(validated_data)
+        location = validated_data.pop("_location", None)
         items_data = validated_data.pop("products")
-        address = validated_data["address"]
-
-        order = Order.objects.create(**validated_data)
 
-        location_cache = validated_data.get("_location_cache")
-        if location_cache:
-            pass
-        else:
-            coords = validated_data.get("_coordinates")
-            if coords:
-                lon, lat = coords
-                Location.objects.update_or_create(
-                    address__iexact=address,
-                    defaults={
-                        "address": address,
-                        "latitude": lat,
-                        "longitude": lon,
-                    }
-                )
+        order = Order(
+            **validated_data,
+            location=location,
+            geocoding_status="done" if location else "pending",
+        )
 
         order_items = []
         for item in items_data:
             product = item["product_id"] 
             order_items.append(OrderItem(
-                order=order,
                 product=product,
                 quantity=item["quantity"],
                 fixed_price=product.price, 
             ))
+        return order, order_items
+
+    @transaction.atomic
+    def create(self, validated_data):
+        order, order_items = self.build_order(validated_data)
+        order.save()
 
+        for order_item in order_items:
+            order_item.order = order
         OrderItem.objects.bulk_create(order_items)
+        order.saved_items = order_items
 
         return order
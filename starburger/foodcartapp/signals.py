@@ -0,0 +1,162 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from geolocation.models import Location
+
+from .candidates import (
+    mark_active_candidates_stale,
+    schedule_candidates_refresh,
+    schedule_menu_candidates_update,
+)
+from .cache import catalog_cache, banners_cache, orders_cache
+from .images import refresh_image_derivatives
+from .models import (
+    Banner,
+    Order,
+    OrderItem,
+    Product,
+    ProductCategory,
+    Restaurant,
+    RestaurantMenuItem,
+)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+def invalidate_catalog_cache(sender, **kwargs):
+    transaction.on_commit(catalog_cache.bump_version)
+
+
+@receiver(post_save, sender=Banner)
+@receiver(post_delete, sender=Banner)
+def invalidate_banners_cache(sender, **kwargs):
+    transaction.on_commit(banners_cache.bump_version)
+
+
+@receiver(post_save, sender=Restaurant)
+def update_candidates_on_restaurant_move(sender, instance, created, raw, **kwargs):
+    # У нового ресторана ещё нет меню, так что кандидатом он стать не может
+    previous_location_id = getattr(instance, "loaded_location_id", instance.location_id)
+    instance.loaded_location_id = instance.location_id
+    if not raw and not created and instance.location_id != previous_location_id:
+        mark_active_candidates_stale()
+
+
+@receiver(post_delete, sender=Restaurant)
+def update_candidates_on_restaurant_delete(sender, instance, **kwargs):
+    mark_active_candidates_stale()
+
+
+@receiver(post_save, sender=Location)
+def update_candidates_on_restaurant_location_change(sender, instance, created, **kwargs):
+    if not created and instance.restaurants.exists():
+        mark_active_candidates_stale()
+
+
+@receiver(post_save, sender=Location)
+def update_candidates_on_location_change(sender, instance, created, raw, **kwargs):
+    if raw or created:
+        return
+    order_ids = list(
+        instance.orders.filter(status__in=Order.ACTIVE_STATUSES).values_list("id", flat=True)
+    )
+    if order_ids:
+        schedule_candidates_refresh(order_ids)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def notify_orders_changed(sender, **kwargs):
+    transaction.on_commit(orders_cache.bump_version)
+
+
+@receiver(post_save, sender=Order)
+def update_candidates_on_order_save(sender, instance, raw, **kwargs):
+    if not raw:
+        schedule_candidates_refresh([instance.id])
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def touch_order_on_item_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    Order.objects.filter(pk=instance.order_id).update(updated_at=timezone.now())
+    transaction.on_commit(orders_cache.bump_version)
+    schedule_candidates_refresh([instance.order_id])
+
+
+@receiver(pre_save, sender=RestaurantMenuItem)
+def remember_menu_item_availability(sender, instance, raw, **kwargs):
+    if raw or instance._state.adding or hasattr(instance, "loaded_availability"):
+        return
+    loaded = (
+        RestaurantMenuItem.objects.filter(pk=instance.pk)
+        .values_list("restaurant_id", "product_id", "availability")
+        .first()
+    )
+    if loaded:
+        instance.loaded_restaurant_id = loaded[0]
+        instance.loaded_availability = loaded[1:]
+    else:
+        instance.loaded_availability = None
+
+
+def shift_product_availability(deltas):
+    for product_id, delta in deltas.items():
+        if delta:
+            Product.objects.filter(pk=product_id).shift_available_restaurants_count(delta)
+
+
+@receiver(post_save, sender=RestaurantMenuItem)
+def update_product_availability_on_save(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    deltas = {}
+    previous = None if created else getattr(instance, "loaded_availability", None)
+    if previous and previous[1]:
+        deltas[previous[0]] = deltas.get(previous[0], 0) - 1
+    if instance.availability:
+        deltas[instance.product_id] = deltas.get(instance.product_id, 0) + 1
+    shift_product_availability(deltas)
+
+    previous_pairs = set()
+    if previous and previous[1]:
+        previous_restaurant_id = getattr(instance, "loaded_restaurant_id", instance.restaurant_id)
+        previous_pairs.add((previous_restaurant_id, previous[0]))
+    current_pairs = {(instance.restaurant_id, instance.product_id)} if instance.availability else set()
+    changed_pairs = previous_pairs ^ current_pairs
+    if changed_pairs:
+        schedule_menu_candidates_update(changed_pairs)
+
+    instance.loaded_availability = (instance.product_id, instance.availability)
+    instance.loaded_restaurant_id = instance.restaurant_id
+
+
+@receiver(post_delete, sender=RestaurantMenuItem)
+def update_product_availability_on_delete(sender, instance, **kwargs):
+    product_id, availability = getattr(
+        instance,
+        "loaded_availability",
+        (instance.product_id, instance.availability),
+    )
+    if availability:
+        shift_product_availability({product_id: -1})
+        restaurant_id = getattr(instance, "loaded_restaurant_id", instance.restaurant_id)
+        schedule_menu_candidates_update([(restaurant_id, product_id)])
+
+
+@receiver(post_save, sender=Product)
+def update_product_image_derivatives(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    if refresh_image_derivatives(instance):
+        transaction.on_commit(catalog_cache.bump_version)
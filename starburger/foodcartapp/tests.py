@@ -0,0 +1,311 @@
+import base64
+import json
+from unittest import mock
+
+from django.db import transaction
+from django.test import TestCase
+
+from geolocation.models import Location
+
+from .candidates import find_orders_affected_by_menu
+from .models import (
+    IdempotencyKey,
+    IdempotencyKeyQuerySet,
+    Order,
+    OrderCandidate,
+    OrderItem,
+    Product,
+    Restaurant,
+    RestaurantMenuItem,
+)
+
+
+class MenuCandidatesTest(TestCase):
+    """Счётчики наличия товаров и кандидаты заказов при правках меню."""
+
+    def setUp(self):
+        self.near = self.create_restaurant("Рядом", 55.76, 37.60)
+        self.far = self.create_restaurant("Подальше", 55.80, 37.60)
+        self.partial = self.create_restaurant("Без картошки", 55.70, 37.60)
+
+        self.burger = Product.objects.create(name="Бургер", price=100, image="")
+        self.fries = Product.objects.create(name="Картошка", price=50, image="")
+        self.cola = Product.objects.create(name="Кола", price=30, image="")
+
+        self.near_burger = self.create_menu_item(self.near, self.burger)
+        self.near_fries = self.create_menu_item(self.near, self.fries)
+        self.create_menu_item(self.far, self.burger)
+        self.create_menu_item(self.far, self.fries)
+        self.partial_burger = self.create_menu_item(self.partial, self.burger)
+        self.create_menu_item(self.far, self.cola)
+
+        self.order = self.create_order(55.75, 37.60, [self.burger, self.fries])
+        self.cola_order = self.create_order(55.75, 37.60, [self.cola])
+
+    def create_restaurant(self, name, lat, lon):
+        location = Location.objects.create(address=f"{name}, {lat}, {lon}", latitude=lat, longitude=lon)
+        return Restaurant.objects.create(name=name, address=location.address, location=location)
+
+    def create_menu_item(self, restaurant, product, availability=True):
+        return RestaurantMenuItem.objects.create(
+            restaurant=restaurant, product=product, availability=availability
+        )
+
+    def create_order(self, lat, lon, products):
+        location = Location.objects.create(
+            address=f"Заказ, {lat}, {lon}, {len(products)}", latitude=lat, longitude=lon
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(
+                firstname="Иван",
+                lastname="Петров",
+                phonenumber="+79991234567",
+                address=location.address,
+                location=location,
+            )
+            for product in products:
+                OrderItem.objects.create(order=order, product=product, fixed_price=product.price)
+        return order
+
+    def get_candidates(self, order):
+        return list(
+            OrderCandidate.objects.filter(order=order)
+            .order_by("rank")
+            .values_list("restaurant_id", "rank")
+        )
+
+    def get_availability(self, product):
+        return Product.objects.filter(pk=product.pk).values_list(
+            "is_available", "available_restaurants_count"
+        ).get()
+
+    def test_new_order_gets_candidates_by_distance(self):
+        self.assertEqual(
+            self.get_candidates(self.order),
+            [(self.near.id, 1), (self.far.id, 2)],
+        )
+        self.assertEqual(self.get_availability(self.burger), (True, 3))
+        self.assertEqual(self.get_availability(self.fries), (True, 2))
+
+    def test_toggle_availability(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.near_fries.availability = False
+            self.near_fries.save()
+        self.assertEqual(self.get_candidates(self.order), [(self.far.id, 1)])
+        self.assertEqual(self.get_availability(self.fries), (True, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.near_fries.availability = True
+            self.near_fries.save()
+        self.assertEqual(
+            self.get_candidates(self.order),
+            [(self.near.id, 1), (self.far.id, 2)],
+        )
+        self.assertEqual(self.get_availability(self.fries), (True, 2))
+
+    def test_toggle_menu_item_loaded_from_db(self):
+        menu_item = RestaurantMenuItem.objects.get(pk=self.near_fries.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            menu_item.availability = False
+            menu_item.save()
+        self.assertEqual(self.get_candidates(self.order), [(self.far.id, 1)])
+        self.assertEqual(self.get_availability(self.fries), (True, 1))
+
+    def test_delete_menu_item(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.near_burger.delete()
+        self.assertEqual(self.get_candidates(self.order), [(self.far.id, 1)])
+        self.assertEqual(self.get_availability(self.burger), (True, 2))
+
+    def test_move_menu_item_to_another_restaurant(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.near_fries.restaurant = self.partial
+            self.near_fries.save()
+        self.assertEqual(
+            self.get_candidates(self.order),
+            [(self.far.id, 1), (self.partial.id, 2)],
+        )
+        self.assertEqual(self.get_availability(self.fries), (True, 2))
+
+    def test_mass_toggle_updates_only_affected_orders(self):
+        cola_order_updated_at = Order.objects.get(pk=self.cola_order.pk).candidates_updated_at
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                for menu_item in RestaurantMenuItem.objects.filter(restaurant=self.far):
+                    menu_item.availability = False
+                    menu_item.save()
+        self.assertEqual(self.get_candidates(self.order), [(self.near.id, 1)])
+        self.assertEqual(self.get_candidates(self.cola_order), [])
+        self.assertEqual(self.get_availability(self.cola), (False, 0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                for menu_item in RestaurantMenuItem.objects.filter(restaurant=self.far):
+                    menu_item.availability = True
+                    menu_item.save()
+        self.assertEqual(
+            self.get_candidates(self.order),
+            [(self.near.id, 1), (self.far.id, 2)],
+        )
+        self.assertEqual(self.get_candidates(self.cola_order), [(self.far.id, 1)])
+        self.assertNotEqual(
+            Order.objects.get(pk=self.cola_order.pk).candidates_updated_at,
+            cola_order_updated_at,
+        )
+
+    def test_change_that_keeps_candidates_affects_no_orders(self):
+        # Ресторану без картошки заказ не подходил ни до, ни после правки
+        affected = find_orders_affected_by_menu({(self.partial.id, self.burger.id)})
+        self.assertEqual(affected, set())
+
+        affected = find_orders_affected_by_menu({(self.near.id, self.cola.id)})
+        self.assertEqual(affected, set())
+
+    def test_completed_orders_are_skipped(self):
+        Order.objects.filter(pk=self.order.pk).update(status="dl")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.near_fries.availability = False
+            self.near_fries.save()
+        self.assertEqual(
+            self.get_candidates(self.order),
+            [(self.near.id, 1), (self.far.id, 2)],
+        )
+
+
+class OrderIdempotencyTest(TestCase):
+    """Повтор заказа с тем же ``Idempotency-Key``."""
+
+    def setUp(self):
+        self.burger = Product.objects.create(name="Бургер", price=100, image="")
+        location = Location.objects.create(
+            address="Москва, ул. Идемпотентная, 1", latitude=55.75, longitude=37.6
+        )
+        self.body = json.dumps({
+            "firstname": "Иван",
+            "lastname": "Петров",
+            "phonenumber": "+79991234567",
+            "address": location.address,
+            "products": [{"product": self.burger.id, "quantity": 2}],
+        })
+
+    def post_order(self, body, key="order-1"):
+        return self.client.post(
+            "/api/order/",
+            body,
+            content_type="application/json",
+            headers={"Idempotency-Key": key},
+        )
+
+    def test_replay_returns_saved_response(self):
+        first = self.post_order(self.body)
+        second = self.post_order(self.body)
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_same_key_with_other_body_is_rejected(self):
+        self.post_order(self.body)
+        other_body = self.body.replace('"quantity": 2', '"quantity": 3')
+
+        response = self.post_order(other_body)
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_saved_by_parallel_request_is_replayed(self):
+        # Параллельный запрос сохранил ключ между проверкой и вставкой
+        IdempotencyKey.objects.create(
+            key_hash=IdempotencyKey.make_hash(b"order-1"),
+            request_hash=IdempotencyKey.make_hash(self.body.encode()),
+            response_status=201,
+            response_body='{"id": 42}',
+        )
+        with mock.patch.object(IdempotencyKeyQuerySet, "first", return_value=None):
+            response = self.post_order(self.body)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response["Idempotent-Replayed"], "true")
+        self.assertEqual(response.json(), {"id": 42})
+        self.assertEqual(Order.objects.count(), 0)
+
+
+class CatalogV2Test(TestCase):
+    """Курсорная пагинация и выбор полей в ``/api/v2/products/``."""
+
+    def setUp(self):
+        location = Location.objects.create(
+            address="Москва, ул. Каталожная, 1", latitude=55.75, longitude=37.6
+        )
+        restaurant = Restaurant.objects.create(
+            name="Каталог", address=location.address, location=location
+        )
+        self.products = [
+            Product.objects.create(name=f"Товар {number}", price=100 + number, image="")
+            for number in range(5)
+        ]
+        for product in self.products:
+            RestaurantMenuItem.objects.create(
+                restaurant=restaurant, product=product, availability=True
+            )
+        Product.objects.create(name="Нет в наличии", price=10, image="")
+
+    def get_page(self, **params):
+        return self.client.get("/api/v2/products/", params)
+
+    @staticmethod
+    def make_cursor(*values):
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).rstrip(b"=").decode()
+
+    def test_pages_cover_available_products_once(self):
+        product_ids = []
+        params = {"limit": 2}
+        while True:
+            page = self.get_page(**params).json()
+            product_ids += [product["id"] for product in page["results"]]
+            if page["next_cursor"] is None:
+                break
+            params["cursor"] = page["next_cursor"]
+
+        self.assertEqual(product_ids, [product.id for product in self.products])
+
+    def test_fields_limit_response(self):
+        response = self.get_page(fields="name, price")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["results"][0],
+            {"name": "Товар 0", "price": "100.00"},
+        )
+
+    def test_restaurants_field(self):
+        result = self.get_page(fields="id,restaurants", limit=1).json()["results"][0]
+
+        self.assertEqual(result["id"], self.products[0].id)
+        self.assertEqual(len(result["restaurants"]), 1)
+
+    def test_unknown_field(self):
+        response = self.get_page(fields="name,secret")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"fields": "Неизвестные поля: secret"})
+
+    def test_invalid_cursor(self):
+        cursors = [
+            "не base64",
+            self.make_cursor(),
+            self.make_cursor(1, 2),
+            self.make_cursor("abc"),
+            self.make_cursor(True),
+            self.make_cursor(1.5),
+            self.make_cursor(-1),
+            self.make_cursor(2 ** 63),
+            "W0luZmluaXR5XQ",
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.get_page(cursor=cursor)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {"error": "Некорректный курсор"})
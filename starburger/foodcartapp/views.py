@@ -1,47 +1,115 @@
-from django.db import transaction
-from django.http import JsonResponse
-from django.templatetags.static import static
-from rest_framework.decorators import api_view
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework import status
 from .serializers import (
+    collect_product_ids,
     OrderCreateSerializer,
     OrderItemCreateSerializer,
     OrderItemResponseSerializer,
 )
-from .models import Product, Order
+from .cache import catalog_cache, banners_cache, orders_cache
+from .candidates import schedule_candidates_refresh
+from .images import DERIVATIVE_FORMATS, build_srcset
+from .pagination import cursor_id, decode_cursor, encode_cursor, parse_limit
+from .models import (
+    Banner,
+    IdempotencyKey,
+    Product,
+    ProductCategory,
+    Order,
+    OrderItem,
+    Restaurant,
+    RestaurantMenuItem,
+)
+from geolocation.geocoders import geocoder_available
+from geolocation.utils import geocode_many, get_locations_by_address
 
 
-def banners_list_api(request):
-    # FIXME move data to db?
-    return JsonResponse(
-        [
-            {
-                "title": "Burger",
-                "src": static("burger.jpg"),
-                "text": "Tasty Burger at your door step",
-            },
-            {
-                "title": "Spices",
-                "src": static("food.jpg"),
-                "text": "All Cuisines",
-            },
-            {
-                "title": "New York",
-                "src": static("tasty.jpg"),
-                "text": "Food is incomplete without a tasty dessert",
-            },
-        ],
-        safe=False,
-        json_dumps_params={
-            "ensure_ascii": False,
-            "indent": 4,
-        },
+def compute_catalog_validators():
+    states = [
+        model.objects.aggregate(last_modified=Max("updated_at"), count=Count("pk"))
+        for model in (Product, ProductCategory, Restaurant, RestaurantMenuItem)
+    ]
+    # Удаление строки не сдвигает max(updated_at), а время сдвига версии кэша — сдвигает
+    changed_at = [state["last_modified"] for state in states]
+    changed_at.append(catalog_cache.get_bumped_at())
+    last_modified = max(filter(None, changed_at), default=None)
+    fingerprint = ";".join(
+        f"{state['count']}@{state['last_modified'] and state['last_modified'].isoformat()}"
+        for state in states
     )
+    return hashlib.md5(fingerprint.encode()).hexdigest(), last_modified
 
 
-def product_list_api(request):
+def catalog_etag(request):
+    etag, _ = catalog_cache.get_validators(compute_catalog_validators)
+    return etag
+
+
+def catalog_v2_etag(request):
+    etag = catalog_etag(request)
+    query = request.GET.urlencode()
+    return hashlib.md5(f"{etag}?{query}".encode()).hexdigest()
+
+
+def catalog_last_modified(request):
+    _, last_modified = catalog_cache.get_validators(compute_catalog_validators)
+    return last_modified
+
+
+def banners_etag(request):
+    return hashlib.md5(banners_cache.get_or_build(dump_banners)).hexdigest()
+
+
+api_cache_control = cache_control(
+    public=True,
+    max_age=settings.CATALOG_CACHE_MAX_AGE,
+    stale_while_revalidate=settings.CATALOG_CACHE_MAX_AGE,
+)
+
+
+def dump_banners():
+    now = timezone.now()
+    banners = Banner.objects.active(now)
+    dumped_banners = [
+        {
+            "title": banner.title,
+            "src": banner.image.url,
+            "text": banner.text,
+        }
+        for banner in banners
+    ]
+    payload = json.dumps(dumped_banners, ensure_ascii=False).encode()
+
+    next_change = Banner.objects.next_schedule_change(now)
+    if next_change is None:
+        return payload, banners_cache.payload_timeout
+    return payload, max(int((next_change - now).total_seconds()), 1)
+
+
+@api_cache_control
+@condition(etag_func=banners_etag)
+def banners_list_api(request):
+    payload = banners_cache.get_or_build(dump_banners)
+    return HttpResponse(payload, content_type="application/json")
+
+
+def dump_product_catalog():
     products = Product.objects.select_related("category").available()
+    restaurants_by_product = RestaurantMenuItem.objects.available_restaurants_by_product()
     dumped_products = []
     for product in products:
         dumped_product = {
@@ -59,49 +127,284 @@ def product_list_api(request):
                 else None
             ),
             "image": product.image.url,
-            "restaurant": {
-                "id": product.id,
-                "name": product.name,
-            },
+            "image_srcset": product.get_image_srcset(),
+            "restaurants": restaurants_by_product.get(product.id, []),
         }
         dumped_products.append(dumped_product)
-    return JsonResponse(
+    return json.dumps(
         dumped_products,
-        safe=False,
-        json_dumps_params={
-            "ensure_ascii": False,
-            "indent": 4,
-        },
+        cls=DjangoJSONEncoder,
+        ensure_ascii=False,
+        indent=4,
+    ).encode()
+
+
+@api_cache_control
+@condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
+def product_list_api(request):
+    payload = catalog_cache.get_or_build(dump_product_catalog)
+    return HttpResponse(payload, content_type="application/json")
+
+
+CATALOG_V2_FIELDS = {
+    "id": ["id"],
+    "name": ["name"],
+    "price": ["price"],
+    "special_status": ["special_status"],
+    "description": ["description"],
+    "category": ["category_id", "category__name"],
+    "image": ["image"],
+    "image_srcset": ["image_derivatives"],
+    "restaurants": [],
+}
+CATALOG_V2_DEFAULT_LIMIT = 50
+CATALOG_V2_MAX_LIMIT = 200
+
+
+def dump_catalog_v2_row(row, fields, restaurants_by_product):
+    dumped = {}
+    for field in fields:
+        if field == "category":
+            dumped["category"] = (
+                {"id": row["category_id"], "name": row["category__name"]}
+                if row["category_id"]
+                else None
+            )
+        elif field == "image":
+            dumped["image"] = (
+                Product.image.field.storage.url(row["image"]) if row["image"] else None
+            )
+        elif field == "image_srcset":
+            dumped["image_srcset"] = {
+                extension: build_srcset(
+                    Product.image.field.storage, row["image_derivatives"], extension
+                )
+                for extension in DERIVATIVE_FORMATS
+                if row["image_derivatives"].get(extension)
+            }
+        elif field == "restaurants":
+            dumped["restaurants"] = restaurants_by_product.get(row["id"], [])
+        else:
+            dumped[field] = row[field]
+    return dumped
+
+
+@api_cache_control
+@condition(etag_func=catalog_v2_etag, last_modified_func=catalog_last_modified)
+def product_list_api_v2(request):
+    requested_fields = request.GET.get("fields")
+    if requested_fields:
+        fields = [field.strip() for field in requested_fields.split(",") if field.strip()]
+    else:
+        fields = list(CATALOG_V2_FIELDS)
+    unknown_fields = [field for field in fields if field not in CATALOG_V2_FIELDS]
+    if unknown_fields:
+        return JsonResponse(
+            {"fields": f"Неизвестные поля: {', '.join(unknown_fields)}"},
+            status=400,
+            json_dumps_params={"ensure_ascii": False},
+        )
+
+    try:
+        limit = parse_limit(
+            request.GET.get("limit"), CATALOG_V2_DEFAULT_LIMIT, CATALOG_V2_MAX_LIMIT
+        )
+        cursor = request.GET.get("cursor")
+        after_id = None
+        if cursor:
+            after_id = cursor_id(decode_cursor(cursor, 1)[0])
+    except ValueError as e:
+        return JsonResponse(
+            {"error": str(e)}, status=400, json_dumps_params={"ensure_ascii": False}
+        )
+
+    columns = {"id"}
+    for field in fields:
+        columns.update(CATALOG_V2_FIELDS[field])
+
+    products = Product.objects.available().order_by("id")
+    if after_id is not None:
+        products = products.filter(id__gt=after_id)
+    rows = list(products.values(*columns)[:limit + 1])
+
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    restaurants_by_product = {}
+    if "restaurants" in fields and rows:
+        restaurants_by_product = (
+            RestaurantMenuItem.objects.available_restaurants_by_product(
+                [row["id"] for row in rows]
+            )
+        )
+    payload = {
+        "results": [
+            dump_catalog_v2_row(row, fields, restaurants_by_product) for row in rows
+        ],
+        "next_cursor": encode_cursor(rows[-1]["id"]) if has_next else None,
+    }
+    return JsonResponse(
+        payload,
+        json_dumps_params={"ensure_ascii": False, "separators": (",", ":")},
+    )
+
+
+def replay_idempotent_response(record, request_hash):
+    if record.request_hash != request_hash:
+        return Response(
+            {"error": "Ключ идемпотентности уже использован для другого заказа"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    response = HttpResponse(
+        record.response_body,
+        status=record.response_status,
+        content_type="application/json",
     )
+    response["Idempotent-Replayed"] = "true"
+    return response
 
 
 @api_view(["POST"])
 @transaction.atomic()
 def register_order(request):
-    serializer = OrderCreateSerializer(data=request.data)
+    idempotency_key = request.headers.get("Idempotency-Key")
+    if idempotency_key is None:
+        return create_order(request)
+    if not idempotency_key or len(idempotency_key) > 255:
+        return Response(
+            {"error": "Ключ идемпотентности должен быть длиной от 1 до 255 символов"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    key_hash = IdempotencyKey.make_hash(idempotency_key.encode())
+    request_hash = IdempotencyKey.make_hash(request.body)
+    IdempotencyKey.objects.filter(key_hash=key_hash).expired().delete()
+
+    record = IdempotencyKey.objects.filter(key_hash=key_hash).first()
+    if record is not None:
+        return replay_idempotent_response(record, request_hash)
+    try:
+        with transaction.atomic():
+            record = IdempotencyKey.objects.create(
+                key_hash=key_hash, request_hash=request_hash
+            )
+    except IntegrityError:
+        # Параллельный запрос с тем же ключом успел сохранить заказ первым
+        record = IdempotencyKey.objects.get(key_hash=key_hash)
+        return replay_idempotent_response(record, request_hash)
+
+    response = create_order(request)
+    record.response_status = response.status_code
+    record.response_body = JSONRenderer().render(response.data).decode()
+    record.save(update_fields=["response_status", "response_body"])
+    return response
+
+
+def create_order(request):
+    serializer = OrderCreateSerializer(
+        data=request.data,
+        context={
+            "products_by_id": Product.objects.in_bulk(collect_product_ids(request.data)),
+        },
+    )
     if not serializer.is_valid():
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     order = serializer.save()
 
-    order_with_data = (
-        Order.objects
-        .with_total_price()
-        .prefetch_related('items__product')
-        .get(id=order.id)
-    )
-
     response_data = {
-        "id": order_with_data.id,
-        "firstname": order_with_data.firstname,
-        "lastname": order_with_data.lastname,
-        "phonenumber": str(order_with_data.phonenumber),
-        "address": order_with_data.address,
-        "created_at": order_with_data.created_at.isoformat(),
-        "products": OrderItemResponseSerializer(
-            order_with_data.items.all(), many=True
-        ).data,
-        "total_cost": order_with_data.total_price or 0,
+        "id": order.id,
+        "firstname": order.firstname,
+        "lastname": order.lastname,
+        "phonenumber": str(order.phonenumber),
+        "address": order.address,
+        "created_at": order.created_at.isoformat(),
+        "products": OrderItemResponseSerializer(order.saved_items, many=True).data,
+        "total_cost": sum(
+            order_item.quantity * order_item.fixed_price
+            for order_item in order.saved_items
+        ),
     }
 
     return Response(response_data, status=status.HTTP_201_CREATED)
+
+
+def parse_ndjson(body):
+    """Разобрать NDJSON построчно: ``(номер строки, данные или None)``."""
+    for line_number, line in enumerate(body.splitlines(), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError:
+            yield line_number, None
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def register_orders_bulk(request):
+    try:
+        lines = list(parse_ndjson(request.body.decode()))
+    except UnicodeDecodeError:
+        return Response(
+            {"error": "Тело запроса должно быть в UTF-8"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if len(lines) > settings.BULK_ORDERS_MAX_LINES:
+        return Response(
+            {"error": f"Не больше {settings.BULK_ORDERS_MAX_LINES} заказов за запрос"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    product_ids = set()
+    addresses = set()
+    for _, order_data in lines:
+        product_ids |= collect_product_ids(order_data)
+        if isinstance(order_data, dict) and isinstance(order_data.get("address"), str):
+            addresses.add(order_data["address"])
+    if not settings.GEOCODE_ORDERS_ASYNC and geocoder_available():
+        # Без фонового геокодера новые адреса партии геокодируются здесь
+        # же, параллельно, а не по одному при проверке каждой строки
+        geocode_many(addresses)
+    context = {
+        "products_by_id": Product.objects.in_bulk(product_ids),
+        "locations_by_address": get_locations_by_address(addresses),
+    }
+
+    results = []
+    built_orders = []
+    for line_number, order_data in lines:
+        if not isinstance(order_data, dict):
+            results.append(
+                {"line": line_number, "errors": {"non_field_errors": ["Некорректный JSON"]}}
+            )
+            continue
+        serializer = OrderCreateSerializer(data=order_data, context=context)
+        if not serializer.is_valid():
+            results.append({"line": line_number, "errors": serializer.errors})
+            continue
+        order, order_items = serializer.build_order(serializer.validated_data)
+        result = {"line": line_number}
+        results.append(result)
+        built_orders.append((result, order, order_items))
+
+    with transaction.atomic():
+        orders = Order.objects.bulk_create([order for _, order, _ in built_orders])
+        all_order_items = []
+        for (result, _, order_items), order in zip(built_orders, orders):
+            result["id"] = order.id
+            for order_item in order_items:
+                order_item.order = order
+            all_order_items.extend(order_items)
+        OrderItem.objects.bulk_create(all_order_items, batch_size=1000)
+        transaction.on_commit(orders_cache.bump_version)
+        schedule_candidates_refresh(order.id for order in orders)
+
+    return Response(
+        {
+            "created": len(built_orders),
+            "failed": len(results) - len(built_orders),
+            "results": results,
+        },
+        status=status.HTTP_200_OK,
+    )
@@ -0,0 +1,48 @@
+import re
+
+NORMALIZED_ADDRESS_MAX_LENGTH = 255
+
+# «пр.» здесь нет: в адресах это и «проспект», и «проезд»
+ABBREVIATIONS = {
+    "г": "город",
+    "гор": "город",
+    "обл": "область",
+    "р-н": "район",
+    "мкр": "микрорайон",
+    "мкрн": "микрорайон",
+    "ул": "улица",
+    "пр-т": "проспект",
+    "просп": "проспект",
+    "пер": "переулок",
+    "пл": "площадь",
+    "б-р": "бульвар",
+    "бул": "бульвар",
+    "ш": "шоссе",
+    "наб": "набережная",
+    "д": "дом",
+    "к": "корпус",
+    "корп": "корпус",
+    "стр": "строение",
+    "кв": "квартира",
+}
+
+TOKEN_RE = re.compile(r"\w+(?:-\w+)*")
+
+
+def normalize_address(address):
+    """Привести адрес к каноническому виду для поиска геоточки.
+
+    Регистр, «ё», знаки препинания, лишние пробелы и привычные сокращения
+    («ул.», «д.», «пр-т») не влияют на результат: «Москва, ул. Ленина, д.5»
+    и «москва улица ленина дом 5» дают одну и ту же строку.
+    """
+    if not address:
+        return ""
+    address = address.casefold().replace("ё", "е")
+    words = []
+    for token in TOKEN_RE.findall(address):
+        if token in ABBREVIATIONS:
+            words.append(ABBREVIATIONS[token])
+        else:
+            words.extend(token.split("-"))
+    return " ".join(words)[:NORMALIZED_ADDRESS_MAX_LENGTH]
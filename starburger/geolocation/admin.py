@@ -6,9 +6,14 @@ class LocationAdmin(admin.ModelAdmin):
     list_display = [
         "address",
         "latitude",
-        "longitude"
-        
+        "longitude",
+        "geocode_error",
+        "geocode_attempts",
+        "next_retry_at",
+    ]
+    list_filter = [
+        "geocode_error",
     ]
     search_fields = [
         "address",
-    ]
\ No newline at end of file
+    ]
@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from . import metrics
+
+
+class LocationCache:
+    """Кэш геоточек в памяти воркера: LRU с ограниченным размером и сроком жизни.
+
+    Ключ — канонический адрес, значение — поля строки ``Location``, из
+    которых при каждом чтении собирается новый экземпляр модели, чтобы
+    потоки не делили один объект. Кэшируются только геоточки с
+    координатами: неудачные адреса меняются при каждой попытке геокодера.
+
+    Другие воркеры узнают об изменениях через версию в общем кэше Django:
+    её сдвигают сигналы сохранения и удаления ``Location``, а воркер
+    сверяется с ней не чаще раза в ``version_check_interval`` секунд.
+    """
+
+    version_key = "geolocation:location-cache:version"
+    version_check_interval = 1
+    stats_flush_interval = 10
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.version = None
+        self.version_checked_at = 0
+        self.hits = 0
+        self.misses = 0
+        self.unflushed_hits = 0
+        self.unflushed_misses = 0
+        self.stats_flushed_at = time.monotonic()
+
+    def get_many(self, keys):
+        """Вернуть словарь ``ключ → Location`` для найденных в кэше ключей."""
+        from .models import Location
+
+        now = time.monotonic()
+        self.check_version(now)
+        field_names = [field.attname for field in Location._meta.concrete_fields]
+        found = {}
+        with self.lock:
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry is None or entry[0] <= now:
+                    self.entries.pop(key, None)
+                    continue
+                self.entries.move_to_end(key)
+                found[key] = Location.from_db(None, field_names, entry[1])
+            hits = len(found)
+            misses = len(keys) - hits
+            self.hits += hits
+            self.misses += misses
+            self.unflushed_hits += hits
+            self.unflushed_misses += misses
+        self.flush_stats(now)
+        return found
+
+    def set_many(self, locations):
+        if not self.maxsize:
+            return
+        expires_at = time.monotonic() + self.timeout
+        with self.lock:
+            for location in locations:
+                if location.pk is None or not location.has_coordinates():
+                    continue
+                values = tuple(
+                    getattr(location, field.attname)
+                    for field in location._meta.concrete_fields
+                )
+                self.entries[location.normalized_address] = (expires_at, values)
+                self.entries.move_to_end(location.normalized_address)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def bump_version(self):
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, time.time_ns(), timeout=None)
+
+    def check_version(self, now):
+        if now - self.version_checked_at < self.version_check_interval:
+            return
+        self.version_checked_at = now
+        version = cache.get(self.version_key)
+        if version != self.version:
+            self.version = version
+            self.clear()
+
+    def flush_stats(self, now):
+        if now - self.stats_flushed_at < self.stats_flush_interval:
+            return
+        with self.lock:
+            hits, self.unflushed_hits = self.unflushed_hits, 0
+            misses, self.unflushed_misses = self.unflushed_misses, 0
+            self.stats_flushed_at = now
+        if hits:
+            metrics.incr("location_cache_hits", hits)
+        if misses:
+            metrics.incr("location_cache_misses", misses)
+
+    def stats(self):
+        return {
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+@lru_cache(maxsize=None)
+def get_location_cache():
+    return LocationCache(
+        settings.GEOCODER_LOCAL_CACHE_SIZE,
+        settings.GEOCODER_LOCAL_CACHE_TTL,
+    )
+
+
+@receiver(setting_changed)
+def reset_location_cache(setting, **kwargs):
+    if setting in ("GEOCODER_LOCAL_CACHE_SIZE", "GEOCODER_LOCAL_CACHE_TTL"):
+        get_location_cache.cache_clear()
@@ -0,0 +1,315 @@
+import csv
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+from functools import lru_cache
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .geometry import Point
+
+logger = logging.getLogger(__name__)
+
+
+class GeocodingError(Exception):
+    """Геокодер недоступен или ответил чем-то непонятным."""
+
+
+class GeocoderUnavailable(GeocodingError):
+    """Геокодер временно отключён предохранителем после серии сбоев."""
+
+
+class CircuitBreaker:
+    """Предохранитель: после ``failure_threshold`` сбоев подряд запросы
+    не выполняются ``reset_timeout`` секунд, затем пропускается одна проба.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probe_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self.lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow_request(self):
+        with self.lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probe_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probe_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                logger.warning(
+                    f"Геокодер отключён на {self.reset_timeout} с после {self.failures} сбоев"
+                )
+
+
+class RateLimiter:
+    """Ограничение частоты запросов к геокодеру: не больше ``rate`` в секунду.
+
+    Счётчик живёт в общем кэше Django, поэтому при общем кэше (Memcached,
+    Redis) лимит действует на все процессы сразу, а с кэшем в памяти —
+    на каждый процесс отдельно. Точным лимит бывает только с атомарным
+    ``incr``: у кэша в базе данных (``DatabaseCache``) ``incr`` — это чтение
+    и запись, и параллельные процессы могут вместе превысить ``rate``.
+    """
+
+    def __init__(self, name, rate):
+        self.name = name
+        self.rate = rate
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            now = time.time()
+            window = int(now)
+            key = f"{self.name}:rate:{window}"
+            cache.add(key, 0, timeout=2)
+            try:
+                used = cache.incr(key)
+            except ValueError:
+                continue
+            if used <= self.rate:
+                return
+            time.sleep(window + 1 - now)
+
+
+class BaseGeocoder:
+    """Интерфейс геокодера.
+
+    ``geocode`` возвращает точку ``Point`` (широта, долгота), ``None``, если адрес
+    не найден, и бросает ``GeocodingError``, если ответить не удалось.
+    """
+
+    def __init__(self, **options):
+        pass
+
+    def geocode(self, address):
+        raise NotImplementedError
+
+    def is_available(self):
+        return True
+
+
+class YandexGeocoder(BaseGeocoder):
+    base_url = "https://geocode-maps.yandex.ru/1.x"
+    retry_statuses = (429, 500, 502, 503, 504)
+
+    def __init__(
+        self,
+        api_key=None,
+        timeout=10,
+        pool_maxsize=10,
+        retries=2,
+        backoff_factor=0.3,
+        backoff_jitter=0.3,
+        failure_threshold=5,
+        reset_timeout=30,
+        **options,
+    ):
+        super().__init__(**options)
+        self.api_key = api_key or settings.YA_API_KEY
+        self.timeout = timeout
+        self.pool_maxsize = pool_maxsize
+        self.retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            backoff_jitter=backoff_jitter,
+            status_forcelist=self.retry_statuses,
+            allowed_methods=["GET"],
+            respect_retry_after_header=True,
+        )
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        # Сессию нельзя делить между процессами после fork() воркеров Gunicorn
+        with self._session_lock:
+            if self._session is None or self._session_pid != os.getpid():
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=self.pool_maxsize,
+                    max_retries=self.retry,
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = session
+                self._session_pid = os.getpid()
+            return self._session
+
+    def is_available(self):
+        return self.breaker.state != CircuitBreaker.OPEN
+
+    def geocode(self, address):
+        if not self.breaker.allow_request():
+            raise GeocoderUnavailable("Геокодер временно недоступен")
+
+        params = {
+            "geocode": address,
+            "apikey": self.api_key,
+            "format": "json",
+        }
+        try:
+            response = self.session.get(self.base_url, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            feature_member = response.json()["response"]["GeoObjectCollection"]["featureMember"]
+            if not feature_member:
+                self.breaker.record_success()
+                return None
+            coords_str = feature_member[0]["GeoObject"]["Point"]["pos"]
+            lon_str, lat_str = coords_str.split()
+            point = Point(float(lat_str), float(lon_str))
+        except requests.exceptions.RequestException as e:
+            self.breaker.record_failure()
+            raise GeocodingError(f"Ошибка сети: {e}") from e
+        except (KeyError, IndexError, ValueError) as e:
+            self.breaker.record_failure()
+            raise GeocodingError(f"Ошибка парсинга ответа Яндекса: {e}") from e
+        except Exception:
+            self.breaker.record_failure()
+            raise
+
+        self.breaker.record_success()
+        return point
+
+
+class CSVGeocoder(BaseGeocoder):
+    """Офлайн-геокодер по CSV-файлу с колонками address, latitude, longitude."""
+
+    def __init__(self, path, **options):
+        super().__init__(**options)
+        self.path = path
+        self._coordinates = None
+
+    @staticmethod
+    def make_key(address):
+        return " ".join(address.lower().split())
+
+    def load(self):
+        coordinates = {}
+        with open(self.path, newline="", encoding="utf-8") as csv_file:
+            for row in csv.DictReader(csv_file):
+                coordinates[self.make_key(row["address"])] = Point(
+                    float(row["latitude"]),
+                    float(row["longitude"]),
+                )
+        return coordinates
+
+    def geocode(self, address):
+        if self._coordinates is None:
+            try:
+                self._coordinates = self.load()
+            except (OSError, KeyError, ValueError) as e:
+                raise GeocodingError(f"Не удалось прочитать {self.path}: {e}") from e
+        return self._coordinates.get(self.make_key(address))
+
+
+class StubGeocoder(BaseGeocoder):
+    """Геокодер для тестов и нагрузочных прогонов без сети.
+
+    Каждому адресу детерминированно соответствует точка в квадрате вокруг
+    ``center`` (широта, долгота). Задержка ответа — ``latency`` ± ``jitter``
+    секунд, доля «ненайденных» адресов — ``not_found_rate``.
+    """
+
+    def __init__(
+        self,
+        latency=0,
+        jitter=0,
+        not_found_rate=0,
+        center=(55.7558, 37.6176),
+        spread=0.3,
+        **options,
+    ):
+        super().__init__(**options)
+        self.latency = latency
+        self.jitter = jitter
+        self.not_found_rate = not_found_rate
+        self.center = center
+        self.spread = spread
+
+    def geocode(self, address):
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        digest = hashlib.sha256(address.strip().lower().encode()).digest()
+        if digest[0] / 256 < self.not_found_rate:
+            return None
+        lon_shift = int.from_bytes(digest[1:5], "big") / 2**32 - 0.5
+        lat_shift = int.from_bytes(digest[5:9], "big") / 2**32 - 0.5
+        center_lat, center_lon = self.center
+        return Point(
+            round(center_lat + lat_shift * self.spread * 2, 6),
+            round(center_lon + lon_shift * self.spread * 2, 6),
+        )
+
+
+@lru_cache(maxsize=None)
+def get_geocoder():
+    config = settings.GEOCODER
+    geocoder_class = import_string(config["BACKEND"])
+    return geocoder_class(**config.get("OPTIONS", {}))
+
+
+@lru_cache(maxsize=None)
+def get_rate_limiter():
+    return RateLimiter("geocoder", settings.GEOCODER_RATE_LIMIT)
+
+
+def geocoder_available():
+    return get_geocoder().is_available()
+
+
+@receiver(setting_changed)
+def reset_geocoder(setting, **kwargs):
+    if setting in ("GEOCODER", "YA_API_KEY"):
+        get_geocoder.cache_clear()
+    if setting == "GEOCODER_RATE_LIMIT":
+        get_rate_limiter.cache_clear()
@@ -0,0 +1,68 @@
+from typing import NamedTuple
+
+import numpy as np
+from geopy.distance import geodesic
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+class Point(NamedTuple):
+    """Точка на карте. Порядок всегда ``(широта, долгота)``, как в geopy."""
+
+    lat: float
+    lon: float
+
+
+def to_radians(points):
+    coordinates = np.array(
+        [(np.nan, np.nan) if point is None else point for point in points],
+        dtype=float,
+    ).reshape(-1, 2)
+    return np.radians(coordinates)
+
+
+def haversine_matrix(origins, destinations):
+    """Расстояния в километрах между всеми парами точек по формуле гаверсинусов.
+
+    Считается одним векторным проходом; погрешность относительно эллипсоида
+    WGS-84 — до 0,5 %, для выбора ближайшего ресторана этого достаточно.
+    """
+    origins = to_radians(origins)
+    destinations = to_radians(destinations)
+    origin_lat = origins[:, 0, np.newaxis]
+    origin_lon = origins[:, 1, np.newaxis]
+    destination_lat = destinations[np.newaxis, :, 0]
+    destination_lon = destinations[np.newaxis, :, 1]
+
+    half_chord = (
+        np.sin((destination_lat - origin_lat) / 2) ** 2
+        + np.cos(origin_lat)
+        * np.cos(destination_lat)
+        * np.sin((destination_lon - origin_lon) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(half_chord, 0, 1)))
+
+
+def geodesic_matrix(origins, destinations):
+    """Точные расстояния по эллипсоиду WGS-84. Медленно: каждая пара считается отдельно."""
+    matrix = np.full((len(origins), len(destinations)), np.nan)
+    for row, origin in enumerate(origins):
+        if origin is None:
+            continue
+        for column, destination in enumerate(destinations):
+            if destination is not None:
+                matrix[row, column] = geodesic(origin, destination).kilometers
+    return matrix
+
+
+def distance_matrix(origins, destinations, exact=False):
+    """Матрица расстояний в километрах между списками точек ``Point``.
+
+    Вместо неизвестной точки можно передать ``None`` — в её строке или
+    столбце будет ``nan``.
+    """
+    if not origins or not destinations:
+        return np.empty((len(origins), len(destinations)))
+    if exact:
+        return geodesic_matrix(origins, destinations)
+    return haversine_matrix(origins, destinations)
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from geolocation.geocoders import get_geocoder
+from geolocation.metrics import METRICS, get_metrics
+from geolocation.models import Location
+
+
+class Command(BaseCommand):
+    help = "Показывает счётчики и состояние геокодера"
+
+    def handle(self, *args, **options):
+        geocoder = get_geocoder()
+        self.stdout.write(f"Геокодер: {type(geocoder).__name__}")
+        breaker = getattr(geocoder, "breaker", None)
+        if breaker:
+            self.stdout.write(f"Предохранитель: {breaker.state}")
+
+        for name, value in get_metrics().items():
+            self.stdout.write(f"{METRICS[name]}: {value}")
+
+        waiting = Location.objects.filter(next_retry_at__gt=timezone.now()).count()
+        self.stdout.write(f"адресов ждут повторного геокодирования: {waiting}")
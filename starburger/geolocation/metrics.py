@@ -0,0 +1,25 @@
+from django.core.cache import cache
+
+METRICS = {
+    "suppressed_lookups": "повторных запросов к геокодеру не сделано (адрес недавно не нашёлся)",
+    "location_cache_hits": "геоточек найдено в памяти воркеров",
+    "location_cache_misses": "геоточек запрошено из базы",
+}
+
+
+def metric_key(name):
+    return f"geolocation:metrics:{name}"
+
+
+def incr(name, delta=1):
+    key = metric_key(name)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.set(key, delta, timeout=None)
+
+
+def get_metrics():
+    values = cache.get_many([metric_key(name) for name in METRICS])
+    return {name: values.get(metric_key(name), 0) for name in METRICS}
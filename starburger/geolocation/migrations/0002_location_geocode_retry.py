@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geolocation', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='geocode_attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='неудачных попыток подряд'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='geocode_error',
+            field=models.CharField(blank=True, choices=[('not_found', 'Адрес не найден'), ('error', 'Ошибка геокодера')], max_length=9, verbose_name='причина неудачи геокодирования'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='next_retry_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='повторить геокодирование после'),
+        ),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:20
+
+import re
+
+from django.db import migrations, models
+
+NORMALIZED_ADDRESS_MAX_LENGTH = 255
+
+# Копия geolocation.addresses.normalize_address на момент миграции, чтобы
+# её правки не меняли то, что делает эта миграция
+ABBREVIATIONS = {
+    "г": "город",
+    "гор": "город",
+    "обл": "область",
+    "р-н": "район",
+    "мкр": "микрорайон",
+    "мкрн": "микрорайон",
+    "ул": "улица",
+    "пр": "проспект",
+    "пр-т": "проспект",
+    "просп": "проспект",
+    "пер": "переулок",
+    "пл": "площадь",
+    "б-р": "бульвар",
+    "бул": "бульвар",
+    "ш": "шоссе",
+    "наб": "набережная",
+    "д": "дом",
+    "к": "корпус",
+    "корп": "корпус",
+    "стр": "строение",
+    "кв": "квартира",
+}
+
+TOKEN_RE = re.compile(r"\w+(?:-\w+)*")
+
+
+def normalize_address(address):
+    if not address:
+        return ""
+    address = address.casefold().replace("ё", "е")
+    words = []
+    for token in TOKEN_RE.findall(address):
+        if token in ABBREVIATIONS:
+            words.append(ABBREVIATIONS[token])
+        else:
+            words.extend(token.split("-"))
+    return " ".join(words)[:NORMALIZED_ADDRESS_MAX_LENGTH]
+
+
+def fill_normalized_address(apps, schema_editor):
+    Location = apps.get_model('geolocation', 'Location')
+    Order = apps.get_model('foodcartapp', 'Order')
+
+    locations_by_address = {}
+    for location in Location.objects.order_by('id').iterator():
+        location.normalized_address = normalize_address(location.address)
+        locations_by_address.setdefault(location.normalized_address, []).append(location)
+
+    duplicate_ids = []
+    for normalized_address, locations in locations_by_address.items():
+        locations.sort(key=lambda location: (location.latitude is None or location.longitude is None, location.id))
+        kept_location, *duplicates = locations
+        kept_location.save(update_fields=['normalized_address'])
+        if duplicates:
+            ids = [location.id for location in duplicates]
+            Order.objects.filter(location_id__in=ids).update(location=kept_location)
+            duplicate_ids.extend(ids)
+
+    Location.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+    # Удаление дублей ставит в очередь отложенные проверки внешних ключей,
+    # поэтому данные коммитятся до изменения схемы таблицы.
+    atomic = False
+
+    dependencies = [
+        ('foodcartapp', '0071_order_geocoding_status'),
+        ('geolocation', '0002_location_geocode_retry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='normalized_address',
+            field=models.CharField(editable=False, max_length=255, null=True, verbose_name='канонический адрес'),
+        ),
+        migrations.RunPython(fill_normalized_address, reverse_code=migrations.RunPython.noop, atomic=True),
+        migrations.AlterField(
+            model_name='location',
+            name='normalized_address',
+            field=models.CharField(editable=False, max_length=255, unique=True, verbose_name='канонический адрес'),
+        ),
+        migrations.AlterField(
+            model_name='location',
+            name='address',
+            field=models.CharField(max_length=200, verbose_name='полный адрес'),
+        ),
+    ]
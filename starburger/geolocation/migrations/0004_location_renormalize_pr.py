@@ -0,0 +1,101 @@
+# Generated by Django 5.2.18 on 2026-10-17 10:40
+
+import re
+
+from django.db import migrations, models
+from django.db.models import Value
+from django.db.models.functions import Cast, Concat
+
+NORMALIZED_ADDRESS_MAX_LENGTH = 255
+
+# Копия geolocation.addresses.normalize_address на момент миграции, чтобы
+# её правки не меняли то, что делает эта миграция
+ABBREVIATIONS = {
+    "г": "город",
+    "гор": "город",
+    "обл": "область",
+    "р-н": "район",
+    "мкр": "микрорайон",
+    "мкрн": "микрорайон",
+    "ул": "улица",
+    "пр-т": "проспект",
+    "просп": "проспект",
+    "пер": "переулок",
+    "пл": "площадь",
+    "б-р": "бульвар",
+    "бул": "бульвар",
+    "ш": "шоссе",
+    "наб": "набережная",
+    "д": "дом",
+    "к": "корпус",
+    "корп": "корпус",
+    "стр": "строение",
+    "кв": "квартира",
+}
+
+TOKEN_RE = re.compile(r"\w+(?:-\w+)*")
+
+
+def normalize_address(address):
+    if not address:
+        return ""
+    address = address.casefold().replace("ё", "е")
+    words = []
+    for token in TOKEN_RE.findall(address):
+        if token in ABBREVIATIONS:
+            words.append(ABBREVIATIONS[token])
+        else:
+            words.extend(token.split("-"))
+    return " ".join(words)[:NORMALIZED_ADDRESS_MAX_LENGTH]
+
+
+def renormalize_addresses(apps, schema_editor):
+    # Без «пр» часть ключей сливается: «Москва, пр. Мира, 5» раньше давал
+    # «москва проспект мира 5», а теперь совпадает с «Москва пр-мира 5».
+    # Дубли схлопываются так же, как в 0003.
+    Location = apps.get_model('geolocation', 'Location')
+    Order = apps.get_model('foodcartapp', 'Order')
+    Restaurant = apps.get_model('foodcartapp', 'Restaurant')
+
+    locations_by_address = {}
+    for location in Location.objects.order_by('id').iterator():
+        normalized_address = normalize_address(location.address)
+        locations_by_address.setdefault(normalized_address, []).append(location)
+
+    changed_locations = []
+    duplicate_ids = []
+    for normalized_address, locations in locations_by_address.items():
+        locations.sort(key=lambda location: (location.latitude is None or location.longitude is None, location.id))
+        kept_location, *duplicates = locations
+        if duplicates:
+            ids = [location.id for location in duplicates]
+            Order.objects.filter(location_id__in=ids).update(location=kept_location)
+            Restaurant.objects.filter(location_id__in=ids).update(location=kept_location)
+            duplicate_ids.extend(ids)
+        if kept_location.normalized_address != normalized_address:
+            kept_location.normalized_address = normalized_address
+            changed_locations.append(kept_location)
+
+    # Дубли удаляются раньше, чем их ключи достанутся оставленным строкам
+    Location.objects.filter(id__in=duplicate_ids).delete()
+    # Ключ одной строки может совпасть со старым ключом другой, поэтому
+    # сначала всем изменённым строкам ставится временный уникальный ключ
+    Location.objects.filter(id__in=[location.id for location in changed_locations]).update(
+        normalized_address=Concat(Value('#'), Cast('id', output_field=models.CharField())),
+    )
+    Location.objects.bulk_update(changed_locations, ['normalized_address'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+    # Удаление дублей ставит в очередь отложенные проверки внешних ключей,
+    # поэтому миграция не оборачивается в одну транзакцию, как и 0003.
+    atomic = False
+
+    dependencies = [
+        ('foodcartapp', '0073_restaurant_location'),
+        ('geolocation', '0003_location_normalized_address'),
+    ]
+
+    operations = [
+        migrations.RunPython(renormalize_addresses, reverse_code=migrations.RunPython.noop, atomic=True),
+    ]
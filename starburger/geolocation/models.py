@@ -1,7 +1,42 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import models
 
+from .addresses import NORMALIZED_ADDRESS_MAX_LENGTH, normalize_address
+from .geometry import Point
+
+
+class LocationQuerySet(models.QuerySet):
+    def for_address(self, address):
+        return self.filter(normalized_address=normalize_address(address))
+
+    def in_bulk_by_address(self, addresses):
+        """Найти геоточки для набора адресов одним запросом по индексу.
+
+        Ключ словаря — канонический адрес из ``normalize_address``.
+        """
+        normalized_addresses = {normalize_address(address) for address in addresses}
+        normalized_addresses.discard("")
+        if not normalized_addresses:
+            return {}
+        return self.in_bulk(normalized_addresses, field_name="normalized_address")
+
+
 class Location(models.Model):
-    address = models.CharField("полный адрес", max_length=200, unique=True)
+    GEOCODE_ERRORS = {
+        "not_found": "Адрес не найден",
+        "error": "Ошибка геокодера",
+    }
+
+    address = models.CharField("полный адрес", max_length=200)
+    normalized_address = models.CharField(
+        "канонический адрес",
+        max_length=NORMALIZED_ADDRESS_MAX_LENGTH,
+        unique=True,
+        editable=False,
+    )
     latitude = models.DecimalField(
         "широта",
         max_digits=9,
@@ -16,12 +51,81 @@ class Location(models.Model):
         null=True,
         blank=True,
     )
+    geocode_error = models.CharField(
+        "причина неудачи геокодирования",
+        max_length=9,
+        choices=GEOCODE_ERRORS,
+        blank=True,
+    )
+    geocode_attempts = models.PositiveSmallIntegerField(
+        "неудачных попыток подряд", default=0
+    )
+    next_retry_at = models.DateTimeField(
+        "повторить геокодирование после", null=True, blank=True, db_index=True
+    )
+
+    objects = LocationQuerySet.as_manager()
 
     class Meta:
         verbose_name = "геоточка (адрес + координаты)"
         verbose_name_plural = "геоточки (адреса с координатами)"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        loaded_fields = {"normalized_address", "latitude", "longitude"}
+        if loaded_fields <= instance.__dict__.keys():
+            instance.loaded_cache_key = (
+                instance.normalized_address if instance.has_coordinates() else None
+            )
+        return instance
+
     def __str__(self):
         if self.latitude is not None and self.longitude is not None:
             return f"{self.address} ({self.latitude}, {self.longitude})"
         return f"{self.address} (координаты не определены)"
+
+    def clean(self):
+        normalized_address = normalize_address(self.address)
+        if not normalized_address:
+            raise ValidationError({"address": "Адрес не может быть пустым"})
+        duplicates = Location.objects.filter(normalized_address=normalized_address)
+        if duplicates.exclude(pk=self.pk).exists():
+            raise ValidationError({"address": "Геоточка для этого адреса уже есть"})
+
+    def save(self, *args, **kwargs):
+        self.normalized_address = normalize_address(self.address)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "address" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "normalized_address"}
+        super().save(*args, **kwargs)
+
+    def has_coordinates(self):
+        return self.latitude is not None and self.longitude is not None
+
+    @property
+    def point(self):
+        if not self.has_coordinates():
+            return None
+        return Point(float(self.latitude), float(self.longitude))
+
+    def is_retry_due(self, now):
+        return self.next_retry_at is None or self.next_retry_at <= now
+
+    @staticmethod
+    def get_retry_delay(attempts):
+        delay = settings.GEOCODER_RETRY_BASE * 2 ** (attempts - 1)
+        return timedelta(seconds=min(delay, settings.GEOCODER_RETRY_MAX))
+
+    def apply_geocode_result(self, point, error, now):
+        """Запомнить ответ геокодера: точку ``Point`` или причину неудачи."""
+        if point:
+            self.latitude, self.longitude = point
+            self.geocode_error = ""
+            self.geocode_attempts = 0
+            self.next_retry_at = None
+            return
+        self.longitude = self.latitude = None
+        self.geocode_error = error
+        self.geocode_attempts += 1
+        self.next_retry_at = now + self.get_retry_delay(self.geocode_attempts)
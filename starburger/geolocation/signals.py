@@ -0,0 +1,19 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import get_location_cache
+from .models import Location
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+def invalidate_location_cache(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    cached_key = getattr(instance, "loaded_cache_key", instance.normalized_address)
+    if cached_key is None:
+        return
+    location_cache = get_location_cache()
+    location_cache.invalidate(cached_key)
+    transaction.on_commit(location_cache.bump_version)
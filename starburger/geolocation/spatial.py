@@ -0,0 +1,148 @@
+import math
+from collections import defaultdict
+from functools import cached_property
+
+from .geometry import EARTH_RADIUS_KM, distance_matrix
+
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+class GridIndex:
+    """Пространственный индекс точек на равномерной сетке.
+
+    Ячейка — примерно ``cell_km`` × ``cell_km`` километров: шаг по долготе
+    считается по самой северной (или южной) точке, поэтому ячейки нигде не
+    бывают уже ``cell_km``. Поиск ближайших обходит кольца ячеек вокруг
+    точки и останавливается, как только следующее кольцо заведомо дальше
+    найденных кандидатов или радиуса поиска.
+    """
+
+    brute_force_limit = 64
+
+    def __init__(self, points, cell_km=2):
+        """``points`` — словарь ``идентификатор → Point``; ``None`` пропускаются."""
+        self.points = {key: point for key, point in points.items() if point is not None}
+        self.cell_km = cell_km
+        max_lat = max((abs(point.lat) for point in self.points.values()), default=0)
+        self.lat_step = cell_km / KM_PER_DEGREE
+        self.lon_step = min(
+            cell_km / (KM_PER_DEGREE * max(math.cos(math.radians(max_lat)), 0.01)),
+            360,
+        )
+
+    def __len__(self):
+        return len(self.points)
+
+    @cached_property
+    def cells(self):
+        # Сетка нужна только поиску по кольцам: короткий список кандидатов
+        # перебирается напрямую, и индекс «на один запрос» её не строит
+        cells = defaultdict(list)
+        for key, point in self.points.items():
+            cells[self.get_cell(point)].append(key)
+        return cells
+
+    @cached_property
+    def bounds(self):
+        rows = [row for row, _ in self.cells] or [0]
+        columns = [column for _, column in self.cells] or [0]
+        return min(rows), max(rows), min(columns), max(columns)
+
+    def get_cell(self, point):
+        return (
+            math.floor(point.lat / self.lat_step),
+            math.floor(point.lon / self.lon_step),
+        )
+
+    def get_max_ring(self, center):
+        row, column = center
+        min_row, max_row, min_column, max_column = self.bounds
+        return max(
+            abs(row - min_row),
+            abs(row - max_row),
+            abs(column - min_column),
+            abs(column - max_column),
+        )
+
+    @staticmethod
+    def get_ring(center, cell):
+        return max(abs(cell[0] - center[0]), abs(cell[1] - center[1]))
+
+    def iter_ring(self, center, ring):
+        row, column = center
+        if ring == 0:
+            yield center
+            return
+        for shift in range(-ring, ring + 1):
+            yield row - ring, column + shift
+            yield row + ring, column + shift
+        for shift in range(-ring + 1, ring):
+            yield row + shift, column - ring
+            yield row + shift, column + ring
+
+    def nearest(self, point, k=None, radius_km=None, candidate_ids=None, exact=False):
+        """Найти ближайшие к ``point`` точки индекса.
+
+        Возвращает список пар ``(идентификатор, расстояние в км)`` по
+        возрастанию расстояния: не больше ``k`` штук и не дальше
+        ``radius_km``. ``candidate_ids`` ограничивает поиск подмножеством
+        точек. С ``exact=True`` расстояния до найденных точек
+        пересчитываются по эллипсоиду.
+        """
+        if candidate_ids is not None and len(candidate_ids) <= self.brute_force_limit:
+            keys = [key for key in candidate_ids if key in self.points]
+            found = self.measure(point, keys)
+        else:
+            found = self.search_rings(point, k, radius_km, candidate_ids)
+
+        if radius_km is not None:
+            found = [(key, distance) for key, distance in found if distance <= radius_km]
+        found.sort(key=lambda pair: pair[1])
+        if k is not None:
+            found = found[:k]
+        if exact and found:
+            keys = [key for key, _ in found]
+            found = self.measure(point, keys, exact=True)
+            found.sort(key=lambda pair: pair[1])
+        return found
+
+    def search_rings(self, point, k, radius_km, candidate_ids):
+        center = self.get_cell(point)
+        found = []
+        for ring in range(self.get_max_ring(center) + 1):
+            if 8 * ring > len(self.cells):
+                # Кольцо длиннее списка занятых ячеек: дешевле добрать остаток целиком
+                keys = [
+                    key
+                    for cell, cell_keys in self.cells.items()
+                    if self.get_ring(center, cell) >= ring
+                    for key in cell_keys
+                    if candidate_ids is None or key in candidate_ids
+                ]
+                found.extend(self.measure(point, keys))
+                break
+            keys = [
+                key
+                for cell in self.iter_ring(center, ring)
+                for key in self.cells.get(cell, ())
+                if candidate_ids is None or key in candidate_ids
+            ]
+            found.extend(self.measure(point, keys))
+
+            # Точки из следующего кольца не ближе ring * cell_km
+            next_ring_distance = ring * self.cell_km
+            if radius_km is not None and next_ring_distance > radius_km:
+                break
+            if k is not None and len(found) >= k:
+                kth_distance = sorted(distance for _, distance in found)[k - 1]
+                if kth_distance <= next_ring_distance:
+                    break
+        return found
+
+    def measure(self, point, keys, exact=False):
+        if not keys:
+            return []
+        distances = distance_matrix(
+            [point], [self.points[key] for key in keys], exact=exact
+        )[0]
+        return [(key, float(distance)) for key, distance in zip(keys, distances)]
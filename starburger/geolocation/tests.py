@@ -1,3 +1,199 @@
-from django.test import TestCase
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+from django.test import SimpleTestCase, TestCase
+
+from foodcartapp.models import Order, Restaurant
+
+from . import geocoders
+from .addresses import NORMALIZED_ADDRESS_MAX_LENGTH, normalize_address
+from .geocoders import CircuitBreaker
+from .models import Location
+
+
+class NormalizeAddressTest(SimpleTestCase):
+    """Канонический вид адреса для поиска геоточки."""
+
+    def test_spelling_does_not_matter(self):
+        addresses = [
+            "Москва, ул. Ленина, д.5",
+            "москва улица ленина дом 5",
+            "  МОСКВА   ул Ленина, д 5 ",
+        ]
+        for address in addresses:
+            with self.subTest(address=address):
+                self.assertEqual(normalize_address(address), "москва улица ленина дом 5")
+
+    def test_yo_is_replaced(self):
+        self.assertEqual(normalize_address("ул. Королёва"), "улица королева")
+
+    def test_hyphenated_abbreviations(self):
+        self.assertEqual(normalize_address("Ленинский пр-т, 1"), "ленинский проспект 1")
+        self.assertEqual(normalize_address("Тверской б-р, 2"), "тверской бульвар 2")
+        self.assertEqual(normalize_address("Нижний Новгород"), "нижний новгород")
+
+    def test_pr_is_not_expanded(self):
+        # «пр.» бывает и проспектом, и проездом
+        self.assertEqual(normalize_address("Москва, пр. Мира, 5"), "москва пр мира 5")
+        self.assertEqual(normalize_address("Москва пр-мира 5"), "москва пр мира 5")
+
+    def test_empty_address(self):
+        self.assertEqual(normalize_address(""), "")
+        self.assertEqual(normalize_address(None), "")
+        self.assertEqual(normalize_address(" ,. "), "")
+
+    def test_long_address_is_truncated(self):
+        self.assertEqual(
+            len(normalize_address("улица " * 100)), NORMALIZED_ADDRESS_MAX_LENGTH
+        )
+
+
+class LocationDeduplicationMigrationTest(TestCase):
+    """Миграции, пересчитывающие канонические адреса, схлопывают дубли геоточек."""
+
+    def run_migration(self, migration_name, function_name):
+        apps = MigrationLoader(connection).project_state(("geolocation", migration_name)).apps
+        module = import_module(f"geolocation.migrations.{migration_name}")
+        getattr(module, function_name)(apps, None)
+
+    def create_location(self, address, normalized_address, latitude=None, longitude=None):
+        """Геоточка с ключом, посчитанным по старым правилам.
+
+        ``Location.save()`` всегда считает ключ заново, поэтому старый ключ
+        записывается отдельным запросом.
+        """
+        location = Location.objects.create(
+            address=normalized_address, latitude=latitude, longitude=longitude
+        )
+        Location.objects.filter(pk=location.pk).update(
+            address=address, normalized_address=normalized_address
+        )
+        return location
+
+    def create_order(self, location):
+        return Order.objects.create(
+            firstname="Иван",
+            lastname="Петров",
+            phonenumber="+79991234567",
+            address=location.address,
+            location=location,
+        )
+
+    def test_normalized_address_keeps_located_duplicate(self):
+        without_coordinates = self.create_location("Москва, ул. Ленина, 5", "старый ключ 1")
+        with_coordinates = self.create_location(
+            "москва улица ленина 5", "старый ключ 2", 55.75, 37.6
+        )
+        order = self.create_order(without_coordinates)
+
+        self.run_migration("0003_location_normalized_address", "fill_normalized_address")
+
+        self.assertEqual(
+            list(Location.objects.values_list("id", "normalized_address")),
+            [(with_coordinates.id, "москва улица ленина 5")],
+        )
+        order.refresh_from_db()
+        self.assertEqual(order.location_id, with_coordinates.id)
+
+    def test_renormalize_pr_merges_locations(self):
+        expanded = self.create_location("Москва, пр. Мира, 5", "москва проспект мира 5")
+        located = self.create_location(
+            "Москва пр-мира 5", "москва пр мира 5", 55.78, 37.63
+        )
+        renamed = self.create_location("Москва, пр. Победы, 1", "москва проспект победы 1")
+        order = self.create_order(expanded)
+        restaurant = Restaurant.objects.create(
+            name="Мира", address=expanded.address, location=expanded
+        )
+
+        self.run_migration("0004_location_renormalize_pr", "renormalize_addresses")
+
+        self.assertEqual(
+            list(Location.objects.order_by("id").values_list("id", "normalized_address")),
+            [
+                (located.id, "москва пр мира 5"),
+                (renamed.id, "москва пр победы 1"),
+            ],
+        )
+        order.refresh_from_db()
+        restaurant.refresh_from_db()
+        self.assertEqual(order.location_id, located.id)
+        self.assertEqual(restaurant.location_id, located.id)
+
+    def test_renormalize_pr_swaps_keys(self):
+        # Новый ключ каждой геоточки — старый ключ другой
+        first = self.create_location("Москва, пр. Мира, 1", "москва пр мира 2")
+        second = self.create_location("Москва, пр. Мира, 2", "москва пр мира 1")
+
+        self.run_migration("0004_location_renormalize_pr", "renormalize_addresses")
+
+        self.assertEqual(
+            list(Location.objects.order_by("id").values_list("id", "normalized_address")),
+            [
+                (first.id, "москва пр мира 1"),
+                (second.id, "москва пр мира 2"),
+            ],
+        )
+
+
+class CircuitBreakerTest(SimpleTestCase):
+    """Переходы предохранителя геокодера между состояниями."""
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(geocoders.time, "monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+
+    def fail(self, times):
+        for _ in range(times):
+            self.breaker.record_failure()
+
+    def test_opens_after_threshold(self):
+        self.fail(2)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow_request())
+
+        self.fail(1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_success_resets_failures(self):
+        self.fail(2)
+        self.breaker.record_success()
+        self.fail(2)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_lets_one_probe_through(self):
+        self.fail(3)
+        self.now += 30
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.breaker.allow_request())
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_successful_probe_closes(self):
+        self.fail(3)
+        self.now += 30
+        self.breaker.allow_request()
+
+        self.breaker.record_success()
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_failed_probe_reopens(self):
+        self.fail(3)
+        self.now += 30
+        self.breaker.allow_request()
+
+        self.breaker.record_failure()
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.now += 29
+        self.assertFalse(self.breaker.allow_request())
+        self.now += 1
+        self.assertTrue(self.breaker.allow_request())
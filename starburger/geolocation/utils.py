@@ -1,16 +1,21 @@
-import requests
 import logging
-from django.db import transaction
+from concurrent.futures import ThreadPoolExecutor
+
 from django.conf import settings
-from geopy.distance import geodesic
+from django.db import transaction
+from django.utils import timezone
 
+from .geocoders import GeocoderUnavailable, GeocodingError, get_geocoder, get_rate_limiter
+from . import metrics
+from .addresses import normalize_address
+from .cache import get_location_cache
 from .models import Location 
 
 logger = logging.getLogger(__name__)
 
 
 def fetch_coordinates(address: str):
-    
+    """Вернуть точку ``Point`` (широта, долгота) для адреса или ``None``."""
     if not address:
         logger.warning("Пустой адрес передан в fetch_coordinates")
         return None
@@ -19,72 +24,171 @@ def fetch_coordinates(address: str):
     if not address:
         return None
 
-    try:
-        location = Location.objects.get(address__iexact=address)
-        if location.latitude is not None and location.longitude is not None:
-            logger.debug(f"Координаты из Location: {address} → ({location.longitude}, {location.latitude})")
-            return float(location.longitude), float(location.latitude)
-        else:
-            logger.info(f"Location существует, но без координат: {address}")
-    except Location.DoesNotExist:
-        location = None
-
-    base_url = "https://geocode-maps.yandex.ru/1.x"
-    params = {
-        "geocode": address,
-        "apikey": settings.YA_API_KEY,
-        "format": "json",
-    }
-
-    lon, lat = None, None
-    try:
-        response = requests.get(base_url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+    now = timezone.now()
+    location = find_location(address)
+    if location and location.has_coordinates():
+        logger.debug(f"Координаты из Location: {address} → {location.point}")
+        return location.point
+    if location and not location.is_retry_due(now):
+        metrics.incr("suppressed_lookups")
+        logger.debug(f"Адрес '{address}' недавно не геокодировался, следующая попытка после {location.next_retry_at}")
+        return None
 
-        feature_member = data["response"]["GeoObjectCollection"]["featureMember"]
-        if not feature_member:
-            logger.info(f"Яндекс ничего не нашёл по адресу: {address}")
-        else:
-            coords_str = feature_member[0]["GeoObject"]["Point"]["pos"]
-            lon_str, lat_str = coords_str.split()
-            lon, lat = float(lon_str), float(lat_str)
-            logger.debug(f"Яндекс вернул координаты: {address} → ({lon}, {lat})")
-
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Ошибка сети при геокодировании адреса '{address}': {e}")
-    except (KeyError, IndexError, ValueError) as e:
-        logger.error(f"Ошибка парсинга ответа Яндекса для адреса '{address}': {e}")
-    except Exception as e:
-        logger.exception(f"Неожиданная ошибка при геокодировании адреса '{address}': {e}")
+    point, error = geocode_address(get_geocoder(), address)
+    if error is None:
+        return None
 
+    if location is None:
+        location = Location(address=address)
+    location.apply_geocode_result(point, error, now)
     try:
         with transaction.atomic():
-            obj, created = Location.objects.update_or_create(
-                address__iexact=address,
-                defaults={
-                    "address": address, 
-                    "longitude": lon,
-                    "latitude": lat,
-                }
-            )
-            if created:
-                logger.info(f"Создана новая Location: {address}")
-            else:
-                logger.info(f"Обновлена Location: {address}")
+            location.save()
     except Exception as e:
         logger.error(f"Ошибка сохранения Location для адреса '{address}': {e}")
 
-    if lon is not None and lat is not None:
-        return lon, lat
-    else:
-        return None
+    return point
 
 
-def calculate_distance(coord1: tuple, coord2: tuple) -> float | None:
-    if None in (coord1, coord2) or coord1 is None or coord2 is None:
-        return None
+def geocode_address(geocoder, address):
+    """Спросить геокодер об адресе.
+
+    Возвращает пару ``(точка, ошибка)``: ошибка — пустая строка при
+    успехе, код из ``Location.GEOCODE_ERRORS`` при неудаче и ``None``, если
+    геокодер отключён предохранителем и ответа не было вовсе.
+    """
     try:
-        return round(geodesic(coord1, coord2).kilometers, 2)
-    except Exception:
-        return None
+        point = geocoder.geocode(address)
+    except GeocoderUnavailable as e:
+        logger.warning(f"Адрес '{address}' не геокодирован: {e}")
+        return None, None
+    except GeocodingError as e:
+        logger.error(f"Ошибка геокодирования адреса '{address}': {e}")
+        return None, "error"
+    except Exception as e:
+        logger.exception(f"Неожиданная ошибка при геокодировании адреса '{address}': {e}")
+        return None, "error"
+
+    if point is None:
+        logger.info(f"Геокодер ничего не нашёл по адресу: {address}")
+        return None, "not_found"
+    logger.debug(f"Геокодер вернул координаты: {address} → {point}")
+    return point, ""
+
+
+def geocode_many(addresses, known_locations=None):
+    """Геокодировать адреса параллельно и сохранить ответы одним запросом.
+
+    Возвращает словарь ``канонический адрес → Point`` или ``None``.
+    Адреса, которые недавно не нашлись, повторно не запрашиваются до
+    ``Location.next_retry_at``. ``known_locations`` — уже загруженные
+    геоточки из ``find_locations``, чтобы не искать их второй раз.
+    """
+    addresses_by_key = {}
+    for address in addresses:
+        key = normalize_address(address)
+        if key:
+            addresses_by_key.setdefault(key, address.strip())
+    if not addresses_by_key:
+        return {}
+    if known_locations is None:
+        known_locations = find_locations(addresses_by_key)
+
+    now = timezone.now()
+    points_by_address = {}
+    addresses_to_geocode = []
+    for key, address in addresses_by_key.items():
+        location = known_locations.get(key)
+        if location and location.has_coordinates():
+            points_by_address[key] = location.point
+        elif location and not location.is_retry_due(now):
+            points_by_address[key] = None
+            metrics.incr("suppressed_lookups")
+        else:
+            addresses_to_geocode.append(address)
+
+    if not addresses_to_geocode:
+        return points_by_address
+
+    geocoder = get_geocoder()
+    rate_limiter = get_rate_limiter()
+
+    def geocode(address):
+        if not geocoder.is_available():
+            return address, None, None
+        return (address, *geocode_address(geocoder, address))
+
+    max_workers = min(settings.GEOCODER_MAX_WORKERS, len(addresses_to_geocode))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        for address in addresses_to_geocode:
+            # Слоты лимита берутся в вызывающем потоке: счётчик живёт в кэше,
+            # и потоки пула иначе открывали бы свои соединения к нему и к базе
+            if geocoder.is_available():
+                rate_limiter.acquire()
+            futures.append(executor.submit(geocode, address))
+        results = [future.result() for future in futures]
+
+    answered_locations = []
+    for address, point, error in results:
+        key = normalize_address(address)
+        points_by_address[key] = point
+        if error is None:
+            continue
+        location = known_locations.get(key) or Location(address=address, normalized_address=key)
+        location.apply_geocode_result(point, error, now)
+        answered_locations.append(location)
+
+    if answered_locations:
+        Location.objects.bulk_create(
+            answered_locations,
+            update_conflicts=True,
+            unique_fields=["normalized_address"],
+            update_fields=[
+                "latitude",
+                "longitude",
+                "geocode_error",
+                "geocode_attempts",
+                "next_retry_at",
+            ],
+        )
+    return points_by_address
+
+
+def find_locations(addresses):
+    """Найти геоточки для набора адресов.
+
+    Геоточки с координатами берутся из кэша в памяти воркера, остальные —
+    одним запросом по индексу ``normalized_address``. Ключ словаря —
+    канонический адрес.
+    """
+    keys = {normalize_address(address) for address in addresses}
+    keys.discard("")
+    if not keys:
+        return {}
+    location_cache = get_location_cache()
+    locations = location_cache.get_many(keys)
+    missing_keys = keys - locations.keys()
+    if missing_keys:
+        loaded_locations = Location.objects.in_bulk(missing_keys, field_name="normalized_address")
+        location_cache.set_many(loaded_locations.values())
+        locations.update(loaded_locations)
+    return locations
+
+
+def find_location(address):
+    return find_locations([address]).get(normalize_address(address))
+
+
+def get_locations_by_address(addresses):
+    """Найти геоточки с координатами для набора адресов одним запросом.
+
+    Ключ словаря — канонический адрес из ``normalize_address``.
+    """
+    locations = find_locations(addresses)
+    return {
+        normalized_address: location
+        for normalized_address, location in locations.items()
+        if location.has_coordinates()
+    }
+
@@ -1,19 +1,29 @@
 from django import forms
+from django.conf import settings
+from django.http import JsonResponse
 from django.shortcuts import redirect, render
-from django.db.models import Prefetch
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.db.models import Prefetch, prefetch_related_objects
 from django.views import View
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.contrib.auth.decorators import user_passes_test
 
 from django.contrib.auth import authenticate, login
 from django.contrib.auth import views as auth_views
 
-from foodcartapp.models import Product, Restaurant, Order
+from foodcartapp.cache import orders_cache
+from foodcartapp.candidates import refresh_order_candidates
+from foodcartapp.models import Product, Restaurant, Order, OrderCandidate
+from foodcartapp.pagination import InvalidCursor, cursor_id, decode_cursor, encode_cursor
 
-from geolocation.models import Location
-from geolocation.utils import fetch_coordinates, calculate_distance
+from geolocation.addresses import normalize_address
+from geolocation.geocoders import geocoder_available
+from geolocation.utils import find_locations, geocode_many
 
 import logging
+import time
+from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
@@ -76,47 +86,47 @@ def is_manager(user):
     )
 
 
-def normalize_address(address):
-    if not address:
-        return ""
-    return address.strip().lower()
+def has_coordinates(location):
+    return location is not None and location.has_coordinates()
 
 
 def get_or_create_locations(addresses):
     if not addresses:
         return {}
 
-    unique_addresses = {
-        normalize_address(addr)
-        for addr in addresses
-        if addr and normalize_address(addr)
-    }
-    if not unique_addresses:
+    addresses_by_key = {}
+    for address in addresses:
+        key = normalize_address(address)
+        if key:
+            addresses_by_key.setdefault(key, address)
+    if not addresses_by_key:
         return {}
 
-    existing_locations = Location.objects.filter(address__in=unique_addresses)
-    location_by_address = {
-        loc.address: (loc.latitude, loc.longitude) for loc in existing_locations
+    existing_locations = find_locations(addresses_by_key)
+    point_by_address = {
+        key: location.point
+        for key, location in existing_locations.items()
+        if location.has_coordinates()
     }
 
-    missing_addresses = unique_addresses - location_by_address.keys()
+    missing_addresses = [
+        address
+        for key, address in addresses_by_key.items()
+        if key not in point_by_address
+    ]
 
     if missing_addresses:
-        for address in missing_addresses:
-            coordinates = fetch_coordinates(address)
-            if coordinates:
-                lat, lon = coordinates
-                location, created = Location.objects.get_or_create(
-                    address=address, defaults={"latitude": lat, "longitude": lon}
-                )
-                location_by_address[address] = (location.latitude, location.longitude)
-            else:
-                location_by_address[address] = None
+        if not geocoder_available():
+            logger.warning("Геокодер недоступен, часть адресов осталась без координат")
+        else:
+            point_by_address.update(
+                geocode_many(missing_addresses, known_locations=existing_locations)
+            )
 
-    for addr in unique_addresses:
-        location_by_address.setdefault(addr, None)
+    for key in addresses_by_key:
+        point_by_address.setdefault(key, None)
 
-    return location_by_address
+    return point_by_address
 
 
 @user_passes_test(is_manager, login_url="restaurateur:login")
@@ -156,52 +166,243 @@ def view_restaurants(request):
     )
 
 
+def attach_restaurant_distances(orders):
+    """Проставить заказам ``restaurant_distances`` из сохранённых ресторанов-кандидатов.
+
+    Заказы, чьи кандидаты ещё не посчитаны или сброшены, пересчитываются
+    здесь же; перед этим геокодируются их адреса.
+    """
+    stale_orders = [order for order in orders if order.candidates_updated_at is None]
+    if stale_orders:
+        get_or_create_locations([
+            order.address
+            for order in stale_orders
+            if order.address.strip()
+            and order.geocoding_status == "done"
+            and not has_coordinates(order.location)
+        ])
+        refresh_order_candidates([order.id for order in stale_orders])
+        for order in stale_orders:
+            order.__dict__.pop("prefetched_candidates", None)
+        prefetch_related_objects(
+            stale_orders,
+            Prefetch(
+                "candidates",
+                queryset=OrderCandidate.objects.select_related("restaurant").order_by("rank"),
+                to_attr="prefetched_candidates",
+            ),
+        )
+
+    for order in orders:
+        order.restaurant_distances = [
+            {
+                "restaurant": candidate.restaurant,
+                "distance": candidate.distance_km,
+            }
+            for candidate in order.prefetched_candidates
+        ]
+    return orders
+
+
+class OrderFilterForm(forms.Form):
+    status = forms.ChoiceField(
+        label="Статус",
+        required=False,
+        choices=[("", "Все активные")]
+        + [(status, Order.ORDER_STATUSES[status]) for status in Order.ACTIVE_STATUSES],
+        widget=forms.Select(attrs={"class": "form-control"}),
+    )
+    cooking_restaurant = forms.ModelChoiceField(
+        label="Ресторан",
+        required=False,
+        queryset=Restaurant.objects.order_by("name"),
+        empty_label="Все рестораны",
+        widget=forms.Select(attrs={"class": "form-control"}),
+    )
+    payment_type = forms.ChoiceField(
+        label="Оплата",
+        required=False,
+        choices=[("", "Любая")] + list(Order.PAYMENT_TYPES.items()),
+        widget=forms.Select(attrs={"class": "form-control"}),
+    )
+    created_from = forms.DateTimeField(
+        label="Создан с",
+        required=False,
+        widget=forms.DateTimeInput(attrs={"class": "form-control", "type": "datetime-local"}),
+    )
+    created_to = forms.DateTimeField(
+        label="по",
+        required=False,
+        widget=forms.DateTimeInput(attrs={"class": "form-control", "type": "datetime-local"}),
+    )
+    unassigned = forms.BooleanField(label="Только без ресторана", required=False)
+
+    def filter_orders(self, orders):
+        filters = self.cleaned_data
+        if filters["status"]:
+            orders = orders.filter(status=filters["status"])
+        if filters["cooking_restaurant"]:
+            orders = orders.filter(cooking_restaurant=filters["cooking_restaurant"])
+        if filters["payment_type"]:
+            orders = orders.filter(payment_type=filters["payment_type"])
+        if filters["created_from"]:
+            orders = orders.filter(created_at__gte=filters["created_from"])
+        if filters["created_to"]:
+            orders = orders.filter(created_at__lte=filters["created_to"])
+        if filters["unassigned"]:
+            orders = orders.filter(cooking_restaurant__isnull=True)
+        return orders
+
+
+ORDERS_FEED_BATCH_SIZE = 100
+ORDERS_FEED_POLL_INTERVAL = 1
+
+
+def get_changes_cursor():
+    """Курсор ленты изменений, с которого панель начинает следить за заказами."""
+    version = orders_cache.get_version()
+    latest = (
+        Order.objects.order_by("-updated_at", "-id")
+        .values_list("updated_at", "id")
+        .first()
+    )
+    updated_at, order_id = latest or (timezone.now(), 0)
+    return encode_cursor(updated_at.isoformat(), order_id, version)
+
+
+def decode_changes_cursor(cursor):
+    updated_at, order_id, version = decode_cursor(cursor, 3)
+    try:
+        return datetime.fromisoformat(updated_at), cursor_id(order_id), version
+    except (TypeError, ValueError) as e:
+        raise InvalidCursor("Некорректный курсор") from e
+
+
+def wait_for_orders_change(version, timeout):
+    """Подождать, пока сдвинется версия заказов. Базу данных не трогает."""
+    deadline = time.monotonic() + timeout
+    current_version = orders_cache.get_version()
+    while current_version == version and time.monotonic() < deadline:
+        time.sleep(ORDERS_FEED_POLL_INTERVAL)
+        current_version = orders_cache.get_version()
+    return current_version
+
+
+def decode_orders_cursor(cursor):
+    created_at, order_id = decode_cursor(cursor, 2)
+    try:
+        return datetime.fromisoformat(created_at), cursor_id(order_id)
+    except (TypeError, ValueError) as e:
+        raise InvalidCursor("Некорректный курсор") from e
+
+
 @user_passes_test(is_manager, login_url="restaurateur:login")
 def view_orders(request):
+    filter_form = OrderFilterForm(request.GET)
     orders = Order.objects.for_manager_panel()
-    if not orders:
-        return render(request, "order_items.html", {"orders": []})
-    order_addresses = [order.address for order in orders if order.address.strip()]
-    restaurant_addresses = list(
-        Restaurant.objects.exclude(address__exact="")
-        .values_list("address", flat=True)
-        .distinct()
-    )
+    if filter_form.is_valid():
+        orders = filter_form.filter_orders(orders)
+
+    cursor = request.GET.get("cursor")
+    if cursor:
+        try:
+            orders = orders.after_cursor(*decode_orders_cursor(cursor))
+        except InvalidCursor:
+            logger.warning(f"Некорректный курсор панели заказов: {cursor}")
+
+    page_size = settings.MANAGER_PANEL_PAGE_SIZE
+    orders = list(orders[:page_size + 1])
+    next_page_query = None
+    if len(orders) > page_size:
+        orders = orders[:page_size]
+        query = request.GET.copy()
+        query["cursor"] = encode_cursor(orders[-1].created_at.isoformat(), orders[-1].id)
+        next_page_query = query.urlencode()
+    first_page_query = None
+    if cursor:
+        query = request.GET.copy()
+        del query["cursor"]
+        first_page_query = query.urlencode()
+
+    context = {
+        "orders": orders,
+        "filter_form": filter_form,
+        "next_page_query": next_page_query,
+        "first_page_query": first_page_query,
+        "changes_cursor": None if cursor else get_changes_cursor(),
+        "orders_feed_wait": settings.ORDERS_FEED_MAX_WAIT,
+        "panel_url": request.get_full_path(),
+        "geocoder_available": geocoder_available(),
+    }
+    attach_restaurant_distances(orders)
+    return render(request, "order_items.html", context)
 
-    all_addresses = set(order_addresses + restaurant_addresses)
-    coordinates_by_address = get_or_create_locations(all_addresses)
 
-    for order in orders:
-        normalized_addr = normalize_address(order.address)
-        order_coords = coordinates_by_address.get(normalized_addr)
-        if not order_coords:
-            order.restaurant_distances = []
-            continue
-        distances = []
-        for restaurant in order.available_restaurants:
-            rest_normalized = normalize_address(restaurant.address)
-            rest_coords = coordinates_by_address.get(rest_normalized)
-
-            if rest_coords:
-                distance = round(calculate_distance(order_coords, rest_coords), 2)
-            else:
-                distance = None
-
-            distances.append(
-                {
-                    "restaurant": restaurant,
-                    "distance": distance,
-                }
-            )
+@user_passes_test(is_manager, login_url="restaurateur:login")
+def view_order_changes(request):
+    """Заказы, изменившиеся после курсора ``since``, с готовыми строками таблицы.
+
+    Если изменений нет, запрос ждёт их до ``wait`` секунд (long polling),
+    сверяясь только с версией заказов в кэше. Заказ с ``visible: false``
+    больше не подходит под фильтры панели, и его строку нужно убрать.
+    """
+    since = request.GET.get("since", "")
+    try:
+        updated_at, order_id, version = decode_changes_cursor(since)
+        wait = min(float(request.GET.get("wait") or 0), settings.ORDERS_FEED_MAX_WAIT)
+    except ValueError:
+        return JsonResponse({"error": "Некорректный курсор"}, status=400)
+
+    current_version = wait_for_orders_change(version, max(wait, 0))
+    if current_version == version:
+        return JsonResponse({"orders": [], "cursor": since, "has_more": False})
+
+    changed_orders = list(
+        Order.objects.with_panel_data()
+        .changed_after(updated_at, order_id)[:ORDERS_FEED_BATCH_SIZE + 1]
+    )
+    has_more = len(changed_orders) > ORDERS_FEED_BATCH_SIZE
+    changed_orders = changed_orders[:ORDERS_FEED_BATCH_SIZE]
 
-        distances.sort(key=lambda x: (x["distance"] is None, x["distance"]))
-        order.restaurant_distances = distances
+    filter_form = OrderFilterForm(request.GET)
+    visible_orders = Order.objects.active().filter(
+        id__in=[order.id for order in changed_orders]
+    )
+    if filter_form.is_valid():
+        visible_orders = filter_form.filter_orders(visible_orders)
+    visible_ids = set(visible_orders.values_list("id", flat=True))
+    attach_restaurant_distances(
+        [order for order in changed_orders if order.id in visible_ids]
+    )
 
-    return render(
-        request,
-        "order_items.html",
+    query = request.GET.copy()
+    for param in ("since", "wait"):
+        query.pop(param, None)
+    panel_url = reverse("restaurateur:view_orders")
+    if query:
+        panel_url = f"{panel_url}?{query.urlencode()}"
+
+    payload = []
+    for order in changed_orders:
+        change = {"id": order.id, "visible": order.id in visible_ids}
+        if change["visible"]:
+            change["html"] = render_to_string(
+                "order_row.html", {"order": order, "panel_url": panel_url}, request
+            )
+        payload.append(change)
+
+    if changed_orders:
+        last_order = changed_orders[-1]
+        updated_at, order_id = last_order.updated_at, last_order.id
+    # Пока не выбраны все изменения, курсор хранит старую версию, чтобы
+    # следующий запрос не ждал, а сразу забрал остаток
+    next_version = version if has_more else current_version
+    return JsonResponse(
         {
-            "orders": orders,
+            "orders": payload,
+            "cursor": encode_cursor(updated_at.isoformat(), order_id, next_version),
+            "has_more": has_more,
         },
+        json_dumps_params={"ensure_ascii": False},
     )
 
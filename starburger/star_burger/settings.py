@@ -11,6 +11,23 @@ environ.Env.read_env(os.path.join(BASE_DIR, ".env"))
 
 
 YA_API_KEY = env("YA_API_KEY")
+GEOCODER = {
+    "BACKEND": env("GEOCODER_BACKEND", default="geolocation.geocoders.YandexGeocoder"),
+    "OPTIONS": env.json("GEOCODER_OPTIONS", default={}),
+}
+GEOCODER_MAX_WORKERS = env.int("GEOCODER_MAX_WORKERS", default=8)
+GEOCODER_RATE_LIMIT = env.int("GEOCODER_RATE_LIMIT", default=10)
+DISTANCE_EXACT = env.bool("DISTANCE_EXACT", default=False)
+MANAGER_PANEL_PAGE_SIZE = env.int("MANAGER_PANEL_PAGE_SIZE", default=50)
+ORDERS_FEED_MAX_WAIT = env.int("ORDERS_FEED_MAX_WAIT", default=25)
+MANAGER_PANEL_RESTAURANTS_LIMIT = env.int("MANAGER_PANEL_RESTAURANTS_LIMIT", default=0)
+GEOCODER_LOCAL_CACHE_SIZE = env.int("GEOCODER_LOCAL_CACHE_SIZE", default=2048)
+GEOCODER_LOCAL_CACHE_TTL = env.int("GEOCODER_LOCAL_CACHE_TTL", default=10 * 60)
+GEOCODER_RETRY_BASE = env.int("GEOCODER_RETRY_BASE", default=60 * 60)
+GEOCODER_RETRY_MAX = env.int("GEOCODER_RETRY_MAX", default=60 * 60 * 24 * 7)
+GEOCODE_ORDERS_ASYNC = env.bool("GEOCODE_ORDERS_ASYNC", default=False)
+BULK_ORDERS_MAX_LINES = env.int("BULK_ORDERS_MAX_LINES", default=5000)
+IDEMPOTENCY_KEY_TTL = env.int("IDEMPOTENCY_KEY_TTL", default=60 * 60 * 24)
 
 SECRET_KEY = env("SECRET_KEY")
 DEBUG = env.bool("DEBUG", default=False)
@@ -111,6 +128,15 @@ WSGI_APPLICATION = "star_burger.wsgi.application"
 
 
 
+# Кэш общий для всех процессов: в нём версии каталога, меню и заказов, по
+# которым воркеры узнают об изменениях. Без CACHE_URL кэш живёт в таблице
+# базы данных (её создаёт createcachetable), в Docker Compose — в Redis
+CACHES = {
+    "default": env.cache("CACHE_URL", default="dbcache://django_cache"),
+}
+
+CATALOG_CACHE_MAX_AGE = env.int("CATALOG_CACHE_MAX_AGE", default=60)
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',